@@ -1,14 +1,23 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import base64
 import os
-import time
+import subprocess
+import sys
+
+import consulta
+import cubo
+import dados
+import exportacao
+import graficos
+import instrumentacao
+import relatorios
+import series
 
 # Configuração da página
 st.set_page_config(layout="wide", page_title="Dashboard PEP & PrEP LGBT", initial_sidebar_state="expanded")
+instrumentacao.iniciar_execucao()
 
 # Aplicar tema Light com CSS ajustado
 st.markdown("""
@@ -25,98 +34,277 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Função para download de dados filtrados
-def download_csv(df, filename):
-    csv = df.to_csv(index=False, encoding='utf-8-sig')
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}.csv">Download CSV</a>'
-    return href
-
-# Função para carregar dados PEP com colunas específicas
-@st.cache_data(ttl=86400)
-def carregar_dados_pep(data_inicio, data_fim, estados):
-    file_path = os.path.join("data", "data.xlsx")
-    if not os.path.exists(file_path):
-        st.error(f"Arquivo '{file_path}' não encontrado no servidor.")
+# Função para carregar o cubo de contagens de uma aba, mapeado em memória e compartilhado
+# entre sessões e entre processos
+@instrumentacao.cache_monitorado(st.cache_resource(max_entries=len(dados.ABAS)), "carregar_cubo")
+def carregar_cubo(chave, versao):
+    return dados.ler_cubo(chave)
+
+# Backend de consulta (DASHBOARD_BACKEND): "pandas" (padrão) ou "duckdb", se instalado
+backend, aviso_backend = consulta.backend_ativo()
+
+# Quando há um relatório pré-gerado por relatorios.py para o filtro (mesma versão dos dados,
+# UFs e período), totais, gráficos e tabelas agregadas são lidos dele em vez de calculados.
+# O relatório é procurado a cada execução, fora dos caches, e sua pasta (ou None) entra na
+# chave deles: um relatório gerado depois passa a ser servido na execução seguinte.
+
+# Função para ler um arquivo de um relatório pré-gerado. Devolve None se não há relatório ou
+# se a leitura falha (ex.: relatório apagado por relatorios.py durante a leitura); nesse
+# caso, o valor é calculado no próprio app.
+def ler_relatorio(leitura, relatorio, *args):
+    if not relatorio:
         return None
     try:
-        with st.spinner("Carregando dados PEP..."):
-            start_time = time.time()
-            df = pd.read_excel(file_path, sheet_name="Banco_PEP_UDM", 
-                              usecols=['dt_disp', 'UF_UDM', 'Pop', 'tipo_exposicao', 'trabalho_sexual', 'alcool_drogas'])
-            if df.empty:
-                st.error("O arquivo de dados PEP está vazio.")
-                return None
-            df['dt_disp'] = pd.to_datetime(df['dt_disp'], errors='coerce')
-            # Filtrar dados
-            df = df[
-                (df['UF_UDM'].isin(estados)) &
-                (df['dt_disp'].dt.date >= data_inicio) &
-                (df['dt_disp'].dt.date <= data_fim)
-            ].copy()
-            return df
-    except Exception as e:
-        st.error(f"Erro ao carregar os dados PEP: {str(e)}")
+        return leitura(relatorio, *args)
+    except OSError as e:
+        instrumentacao.logger.warning(f"Relatório indisponível, calculando no app: {str(e)}")
         return None
 
-# Função para carregar dados PrEP com colunas específicas
-@st.cache_data(ttl=86400)
-def carregar_dados_prep(data_inicio, data_fim, estados):
-    file_path = os.path.join("data", "data.xlsx")
-    if not os.path.exists(file_path):
-        st.error(f"Arquivo '{file_path}' não encontrado no servidor.")
-        return None
+# Função para obter o total de registros por UF selecionada, em uma única passada
+@instrumentacao.cache_monitorado(st.cache_data(max_entries=256), "totais_estados")
+def totais_estados(chave, versao, data_inicio, data_fim, estados, relatorio):
+    pronto = ler_relatorio(relatorios.ler_totais, relatorio)
+    if pronto is not None:
+        return pronto
+    if backend == "duckdb":
+        return consulta.totais_por_uf(chave, data_inicio, data_fim, estados)
+    return cubo.totais_por_uf(carregar_cubo(chave, versao), data_inicio, data_fim, estados)
+
+# Função para agregar, em uma única passada pelo cubo (ou uma única consulta no DuckDB),
+# todas as dimensões usadas pelos gráficos de uma página (a mesma tabela serve às visões
+# percentual e bruta)
+@instrumentacao.cache_monitorado(st.cache_data(max_entries=256), "agregar_pagina")
+def agregar_pagina(chave, versao, data_inicio, data_fim, estados):
+    if backend == "duckdb":
+        return consulta.distribuicoes(chave, graficos.dimensoes_pagina(chave), data_inicio, data_fim, estados)
+    return cubo.distribuicoes(carregar_cubo(chave, versao), graficos.dimensoes_pagina(chave), data_inicio, data_fim, estados)
+
+# Função para montar o gráfico de índice `indice` do registro da página, em cache por
+# filtro e versão dos dados. Devolve a figura e o tamanho do seu JSON em bytes.
+# Fica em cache_resource (sem cópia): desserializar uma go.Figure a cada acesso custa mais
+# do que montá-la. A figura não deve ser alterada por quem a recebe.
+@instrumentacao.cache_monitorado(st.cache_resource(max_entries=1024), "construir_grafico")
+def construir_grafico(chave, versao, indice, data_inicio, data_fim, estados, relatorio):
+    pronto = ler_relatorio(relatorios.ler_figura, relatorio, f"grafico_{indice}")
+    if pronto is not None:
+        return pronto
+    grafico = graficos.PAGINAS[chave]["graficos"][indice]
+    tabelas = agregar_pagina(chave, versao, data_inicio, data_fim, estados)
+    fig = graficos.figura(grafico, tabelas[grafico["dimensao"]])
+    return fig, len(fig.to_json().encode("utf-8"))
+
+# Função para montar o gráfico de evolução temporal de uma página: contagens diárias por UF
+# (ou por valor de `dimensao`), reamostradas na frequência escolhida e reduzidas por LTTB.
+# Devolve a figura e o tamanho do seu JSON em bytes.
+@instrumentacao.cache_monitorado(st.cache_resource(max_entries=256), "construir_serie")
+def construir_serie(chave, versao, frequencia, dimensao, data_inicio, data_fim, estados, relatorio):
+    if frequencia == relatorios.FREQUENCIA_SERIE and dimensao is None:
+        pronto = ler_relatorio(relatorios.ler_figura, relatorio, "serie")
+        if pronto is not None:
+            return pronto
+    if backend == "duckdb":
+        diaria = consulta.serie_diaria(chave, data_inicio, data_fim, estados, dimensao)
+    else:
+        diaria = cubo.serie_diaria(carregar_cubo(chave, versao), data_inicio, data_fim, estados, dimensao)
+    fig = graficos.figura_evolucao(chave, diaria, frequencia, dimensao)
+    return fig, len(fig.to_json().encode("utf-8"))
+
+# Função para ler e filtrar as linhas de uma aba, em lotes consumidos um a um pela
+# exportação. Cada UF selecionada é lida e filtrada separadamente, de modo que só as
+# partições dos estados escolhidos são lidas; o recorte só é convertido para o pandas em
+# lotes (dados.lotes), quando a exportação chega a cada um. No backend DuckDB, o filtro
+# roda no motor e as linhas chegam em lotes do próprio motor (o filtro é medido junto com
+# a exportação, na etapa "exportar").
+def filtrar_linhas(chave, versao, data_inicio, data_fim, estados):
+    if backend == "duckdb":
+        yield from consulta.linhas(chave, data_inicio, data_fim, estados)
+        return
+    fatias = []
+    for uf in estados:
+        segmentos = carregar_base(chave, versao, uf)
+        # Filtrar dados
+        with instrumentacao.etapa("filtrar", aba=chave, uf=uf,
+                                  linhas_entrada=sum(tabela.num_rows for _, tabela in segmentos)) as registro:
+            fatias_uf = dados.fatiar(segmentos, data_inicio, data_fim)
+            registro["linhas_saida"] = sum(fatia.num_rows for fatia in fatias_uf)
+        fatias.extend(fatias_uf)
+    yield from dados.lotes(fatias, chave)
+
+# Seções das páginas de dados. Cada uma é um fragmento: a interação com um widget dela
+# (aba, frequência, formato...) reexecuta apenas a própria seção, com os filtros da última
+# execução completa. Uma mudança nos filtros da sidebar reexecuta a página, e os caches
+# garantem que só os resultados que dependem do filtro alterado sejam recalculados.
+
+# Visualizações descritas no registro, em abas preguiçosas: só a aba aberta é montada
+@st.fragment
+def secao_visualizacoes(chave, versao, data_inicio, data_fim, estados, relatorio):
+    with instrumentacao.execucao_fragmento("visualizacoes", pagina=chave):
+        pagina = graficos.PAGINAS[chave]
+        visoes = [(rotulo, [i for i, grafico in enumerate(pagina["graficos"]) if grafico["percentual"] == percentual])
+                  for rotulo, percentual in (("Percentuais", True), ("Valores Brutos", False))]
+        visoes = [(rotulo, indices) for rotulo, indices in visoes if indices]
+        if not visoes:
+            return
+        st.subheader("Visualizações")
+        abas = st.tabs([rotulo for rotulo, _ in visoes], key=f"visoes_{chave}", on_change="rerun")
+        for aba, (_, indices) in zip(abas, visoes):
+            if not aba.open:
+                continue
+            with aba:
+                # Gráficos em pares por linha
+                for inicio in range(0, len(indices), 2):
+                    for coluna, indice in zip(st.columns(2), indices[inicio:inicio + 2]):
+                        with coluna:
+                            st.markdown(f"#### {pagina['graficos'][indice]['cabecalho']}")
+                            fig, tamanho = construir_grafico(chave, versao, indice, data_inicio, data_fim, estados, relatorio)
+                            with instrumentacao.etapa("plotly_chart", aba=chave, grafico=indice, bytes=tamanho):
+                                st.plotly_chart(fig, use_container_width=True)
+
+# Evolução temporal das dispensações, por estado ou por categoria
+@st.fragment
+def secao_evolucao(chave, versao, data_inicio, data_fim, estados, relatorio):
+    with instrumentacao.execucao_fragmento("evolucao", pagina=chave):
+        st.subheader("Evolução Temporal")
+        rotulos = graficos.rotulos_dimensoes(chave)
+        col1, col2 = st.columns(2)
+        with col1:
+            frequencia = st.radio("Frequência", list(series.FREQUENCIAS), index=2, horizontal=True, key=f"frequencia_{chave}")
+        with col2:
+            detalhe = st.selectbox("Detalhar por", [None] + list(rotulos), key=f"detalhe_{chave}",
+                                   format_func=lambda dimensao: "Estado" if dimensao is None else rotulos[dimensao])
+        fig, tamanho = construir_serie(chave, versao, frequencia, detalhe, data_inicio, data_fim, estados, relatorio)
+        with instrumentacao.etapa("plotly_chart", aba=chave, serie=frequencia, bytes=tamanho):
+            st.plotly_chart(fig, use_container_width=True)
+
+# Exportação sob demanda: o arquivo só é gerado, em blocos, quando o usuário clica em baixar
+@st.fragment
+def secao_exportacao(chave, versao, data_inicio, data_fim, estados):
+    with instrumentacao.execucao_fragmento("exportacao", pagina=chave):
+        st.subheader("Exportar Dados")
+        col1, col2 = st.columns(2)
+        with col1:
+            conteudo = st.radio("Conteúdo", ["Linhas filtradas", "Tabelas agregadas"], horizontal=True, key=f"conteudo_{chave}")
+        with col2:
+            formato = st.radio("Formato", list(exportacao.FORMATOS), horizontal=True, key=f"formato_{chave}")
+        extensao, mime = exportacao.FORMATOS[formato]
+        if conteudo == "Linhas filtradas":
+            nome_arquivo = f"dados_filtrados_{chave}.{extensao}"
+        else:
+            nome_arquivo = f"dados_agregados_{chave}.{extensao}"
+
+        # Chamada pelo Streamlit no clique, em uma thread do servidor fora da execução do
+        # script: é registrada como uma execução própria, para que as etapas de filtro e
+        # exportação apareçam no diagnóstico
+        def gerar_exportacao():
+            with instrumentacao.execucao_fragmento("download", pagina=chave, backend=backend):
+                with instrumentacao.etapa("exportar", aba=chave, conteudo=conteudo, formato=formato, backend=backend):
+                    if conteudo == "Linhas filtradas":
+                        tabela_exportacao = filtrar_linhas(chave, versao, data_inicio, data_fim, estados)
+                    else:
+                        pronto = relatorios.procurar(chave, versao, data_inicio, data_fim, estados)
+                        tabela_exportacao = ler_relatorio(relatorios.ler_tabelas, pronto)
+                        if tabela_exportacao is None:
+                            tabela_exportacao = exportacao.tabela_agregada(agregar_pagina(chave, versao, data_inicio, data_fim, estados))
+                    return exportacao.exportar(tabela_exportacao, formato)
+
+        st.download_button("Download", data=gerar_exportacao, file_name=nome_arquivo, mime=mime, on_click="ignore")
+
+# Aquecimento, uma vez por processo do servidor: converte em paralelo as abas com cache
+# desatualizado e carrega os cubos de todas as abas antes de montar a primeira página (as
+# linhas de cada UF só são lidas quando exportadas).
+# A conversão roda em um processo à parte (preparar.py), pois o Streamlit substitui o
+# __main__ do processo e impede o uso direto de um pool com "spawn" a partir do app.
+# Em produção, rode `python preparar.py` antes de `streamlit run` para que isso seja imediato.
+@st.cache_resource
+def aquecer():
+    try:
+        with instrumentacao.etapa("aquecer") as registro:
+            pendentes = [chave for chave in dados.ABAS if not dados.cache_atualizado(chave)]
+            if pendentes:
+                comando = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preparar.py")]
+                subprocess.run(comando, check=True, capture_output=True)
+            registro["abas_convertidas"] = pendentes
+            for chave in dados.ABAS:
+                versao = dados.versao_dados(chave)
+                if backend == "pandas":
+                    carregar_cubo(chave, versao)
+    except Exception as e:
+        # Os carregadores exibem o erro na página correspondente
+        instrumentacao.logger.warning(f"Falha no aquecimento dos caches: {str(e)}")
+
+# Função para ler o índice de metadados de uma aba (período, UFs e categorias)
+def carregar_metadados(chave):
     try:
-        with st.spinner("Carregando dados PrEP..."):
-            start_time = time.time()
-            df = pd.read_excel(file_path, sheet_name="Banco_PrEP_UDM", 
-                              usecols=['dt_disp', 'UF_UDM', 'tp_servico_atendimento', 'tp_esquema_prep', 'tp_testagem_hiv', 'IST_autorrelato'])
-            if df.empty:
-                st.error("O arquivo de dados PrEP está vazio.")
-                return None
-            df['dt_disp'] = pd.to_datetime(df['dt_disp'], errors='coerce')
-            # Filtrar dados
-            df = df[
-                (df['UF_UDM'].isin(estados)) &
-                (df['dt_disp'].dt.date >= data_inicio) &
-                (df['dt_disp'].dt.date <= data_fim)
-            ].copy()
-            return df
+        with instrumentacao.etapa("ler_metadados", aba=chave):
+            return dados.ler_metadados(chave)
     except Exception as e:
-        st.error(f"Erro ao carregar os dados PrEP: {str(e)}")
+        st.sidebar.warning(f"Metadados indisponíveis: {str(e)}")
         return None
 
+with st.spinner("Preparando os dados..."):
+    aquecer()
+
+# Função para contar as UFs armazenadas de todas as abas, que limita o cache das linhas
+# mapeadas (uma entrada por UF); sem metadados, considera as 27 UFs em cada aba
+def total_ufs():
+    try:
+        return sum(len(dados.ler_metadados(chave)["ufs"]) for chave in dados.ABAS)
+    except Exception:
+        return len(dados.ABAS) * 27
+
+# Função para mapear em memória as linhas de uma UF de uma aba (um segmento por mês), por
+# versão dos dados. Os segmentos são visões sobre os arquivos Arrow, compartilhadas entre
+# sessões e entre processos.
+# Definida depois do aquecimento, que prepara os metadados usados para dimensionar o cache.
+@instrumentacao.cache_monitorado(st.cache_resource(max_entries=max(total_ufs(), 1)), "carregar_base")
+def carregar_base(chave, versao, uf):
+    return dados.mapear_linhas(chave, uf)
 
 # Sidebar com navegação e filtros
 st.sidebar.title("Navegação e Filtros")
-menu = st.sidebar.radio("Selecione a Página", ["🏠 Home", "💉 PEP", "🔒 PrEP"])
+if aviso_backend:
+    st.sidebar.warning(aviso_backend)
+paginas_menu = {pagina["menu"]: chave for chave, pagina in graficos.PAGINAS.items()}
+menu = st.sidebar.radio("Selecione a Página", ["🏠 Home"] + list(paginas_menu))
+chave_pagina = paginas_menu.get(menu)
+metadados = carregar_metadados(chave_pagina) if chave_pagina else None
 
 # Filtros globais
 st.sidebar.header("Filtros")
-estados = st.sidebar.multiselect("Estados", options=['BA', 'RJ'], default=['BA', 'RJ'])
-
-# Função para determinar o intervalo de datas com base nos dados
-def get_date_range(df_func, *args):
-    df = df_func(*args)
-    if df is not None and not df.empty:
-        min_date = df['dt_disp'].min().date()
-        max_date = df['dt_disp'].max().date()
+opcoes_estados = metadados["ufs"] if metadados else ['BA', 'RJ']
+estados = st.sidebar.multiselect("Estados", options=opcoes_estados, default=opcoes_estados)
+
+# Função para determinar o intervalo de datas a partir dos metadados
+def get_date_range(metadados):
+    if metadados and metadados["data_min"]:
+        min_date = datetime.fromisoformat(metadados["data_min"]).date()
+        max_date = datetime.fromisoformat(metadados["data_max"]).date()
         return min_date, max_date
-    return datetime(2020, 1, 1).date(), datetime(2025, 5, 19).date()  # Fallback caso os dados estejam vazios
+    return datetime(2020, 1, 1).date(), datetime(2025, 5, 19).date()  # Fallback caso os metadados não estejam disponíveis
 
 # Inicializar datas com base na aba selecionada (ajustado dinamicamente)
-if menu == "💉 PEP":
-    min_date, max_date = get_date_range(carregar_dados_pep, None, None, estados)
-    data_inicio = st.sidebar.date_input("Data de Início", value=min_date, min_value=min_date, max_value=max_date)
-    data_fim = st.sidebar.date_input("Data de Fim", value=max_date, min_value=min_date, max_value=max_date)
-elif menu == "🔒 PrEP":
-    min_date, max_date = get_date_range(carregar_dados_prep, None, None, estados)
+if chave_pagina:
+    min_date, max_date = get_date_range(metadados)
     data_inicio = st.sidebar.date_input("Data de Início", value=min_date, min_value=min_date, max_value=max_date)
     data_fim = st.sidebar.date_input("Data de Fim", value=max_date, min_value=min_date, max_value=max_date)
 else:  # Home
     # Fallback para Home (pode ser ajustado conforme necessário)
     data_inicio = st.sidebar.date_input("Data de Início", value=None)
     data_fim = st.sidebar.date_input("Data de Fim", value=None)
+instrumentacao.anotar(pagina=chave_pagina or "home", backend=backend, estados=estados, data_inicio=data_inicio, data_fim=data_fim)
+
+# Painel de diagnóstico, visível apenas com ?admin=<DASHBOARD_ADMIN_TOKEN> na URL
+token_admin = os.environ.get("DASHBOARD_ADMIN_TOKEN")
+if token_admin and st.query_params.get("admin") == token_admin:
+    with st.sidebar.expander("🛠️ Diagnóstico"):
+        st.caption(f"Percentis das últimas {instrumentacao.MAXIMO_EXECUCOES} execuções (ms)")
+        st.dataframe(instrumentacao.resumo_etapas().round(2), hide_index=True)
+        st.caption("Cache (acertos e falhas desde o início do servidor)")
+        st.dataframe(instrumentacao.resumo_cache().round(3), hide_index=True)
+        ultima = instrumentacao.ultima_execucao()
+        if ultima:
+            st.caption("Última execução")
+            st.dataframe(pd.DataFrame(ultima["etapas"]), hide_index=True)
 
 # Página Home
 if menu == "🏠 Home":
@@ -149,289 +337,48 @@ if menu == "🏠 Home":
     - **Pesquisa Adicional**: Conduzir estudos para entender as barreiras ao acesso na BA e melhorar as políticas públicas.
     """)
 
-# Página PEP
-elif menu == "💉 PEP":
-    st.title("📊 Análise Comparativa da Dispersão de PEP - BA x RJ")
-    st.warning("Os dados foram coletados pela **Agência Nacional de Saúde (ANS)** e representam 90% de registros do RJ e apenas 10% da BA, o que pode impactar as comparações. Use os dados da BA com cautela devido ao tamanho limitado da amostra.")
-    st.markdown("""
-    🔗 **Fonte dos Dados**: [PEP - Profilaxia Pós-Exposição ao HIV](https://www.gov.br/aids/pt-br/indicadores-epidemiologicos/painel-de-monitoramento/painel-pep)
-    """, unsafe_allow_html=True)
+# Páginas de dados (PEP, PrEP e demais entradas de graficos.PAGINAS)
+else:
+    pagina = graficos.PAGINAS[chave_pagina]
+    st.title(pagina["titulo"])
+    st.warning(pagina["aviso"])
+    st.markdown(pagina["fonte"], unsafe_allow_html=True)
 
-    # Definir intervalo de datas com base nos dados PEP
-    df = carregar_dados_pep(data_inicio, data_fim, estados)
-    if df is None or df.empty:
-        st.warning("Nenhum dado disponível com os filtros selecionados.")
+    # Resumo e gráficos vêm de contagens agregadas; as linhas só são lidas na exportação
+    try:
+        versao = dados.versao_dados(chave_pagina)
+        relatorio = relatorios.procurar(chave_pagina, versao, data_inicio, data_fim, estados)
+        instrumentacao.anotar(relatorio=relatorio is not None)
+        # Totais de todas as UFs selecionadas em uma única passada
+        totais = totais_estados(chave_pagina, versao, data_inicio, data_fim, estados, relatorio)
+    except Exception as e:
+        st.error(f"Erro ao carregar os dados {dados.ABAS[chave_pagina]['nome']}: {str(e)}")
+        instrumentacao.finalizar_execucao()
         st.stop()
-
-    # Métricas resumidas
-    st.subheader("Resumo dos Dados")
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        total_registros = len(df)
-        st.markdown(f"<div class='metric-card'><strong>Total de Registros</strong><br>{total_registros}</div>", unsafe_allow_html=True)
-    with col2:
-        total_ba = len(df[df['UF_UDM'] == 'BA'])
-        percent_ba = round((total_ba / total_registros * 100), 2) if total_registros > 0 else 0
-        st.markdown(f"<div class='metric-card'><strong>Total BA</strong><br>{total_ba} ({percent_ba}%)</div>", unsafe_allow_html=True)
-    with col3:
-        total_rj = len(df[df['UF_UDM'] == 'RJ'])
-        percent_rj = round((total_rj / total_registros * 100), 2) if total_registros > 0 else 0
-        st.markdown(f"<div class='metric-card'><strong>Total RJ</strong><br>{total_rj} ({percent_rj}%)</div>", unsafe_allow_html=True)
-
-    # Visualizações com percentuais
-    st.subheader("Visualizações (Percentuais)")
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("#### Distribuição por Grupo Populacional")
-        fig1 = px.histogram(df, x='Pop', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            labels={'Pop': 'Grupo Populacional', 'count': 'Percentual'},
-                            title="Grupos Populacionais por Estado (Percentual)",
-                            category_orders={'Pop': sorted(df['Pop'].dropna().unique())},
-                            text_auto=True)
-        fig1.update_traces(textposition='auto', texttemplate='%{y:.2f}%', textfont=dict(color='#000000'))
-        fig1.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Grupos Populacionais por Estado (Percentual)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Grupo Populacional", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig1, use_container_width=True)
-
-    with col2:
-        st.markdown("#### Tipo de Exposição")
-        fig2 = px.histogram(df, x='tipo_exposicao', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            labels={'tipo_exposicao': 'Tipo de Exposição', 'count': 'Percentual'},
-                            title="Tipo de Exposição por Estado (Percentual)",
-                            text_auto=True)
-        fig2.update_traces(textposition='auto', texttemplate='%{y:.2f}%', textfont=dict(color='#000000'))
-        fig2.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Tipo de Exposição por Estado (Percentual)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Tipo de Exposição", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig2, use_container_width=True)
-
-    col3, col4 = st.columns(2)
-    with col3:
-        st.markdown("#### Trabalho Sexual")
-        fig3 = px.histogram(df, x='trabalho_sexual', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            title="Trabalho Sexual por Estado (Percentual)",
-                            labels={'trabalho_sexual': 'Trabalho Sexual', 'count': 'Percentual'},
-                            text_auto=True)
-        fig3.update_traces(textposition='auto', texttemplate='%{y:.2f}%', textfont=dict(color='#000000'))
-        fig3.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Trabalho Sexual por Estado (Percentual)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Trabalho Sexual", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig3, use_container_width=True)
-
-    with col4:
-        st.markdown("#### Uso de Álcool/Drogas")
-        fig4 = px.histogram(df, x='alcool_drogas', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            title="Uso de Álcool/Drogas por Estado (Percentual)",
-                            labels={'alcool_drogas': 'Álcool/Drogas', 'count': 'Percentual'},
-                            text_auto=True)
-        fig4.update_traces(textposition='auto', texttemplate='%{y:.2f}%', textfont=dict(color='#000000'))
-        fig4.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Uso de Álcool/Drogas por Estado (Percentual)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Álcool/Drogas", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig4, use_container_width=True)
-
-    # Visualizações com valores brutos
-    st.subheader("Visualizações (Valores Brutos)")
-    col5, col6 = st.columns(2)
-    with col5:
-        st.markdown("#### Distribuição por Grupo Populacional (Bruto)")
-        fig5 = px.histogram(df, x='Pop', color='UF_UDM', barmode='group',
-                            labels={'Pop': 'Grupo Populacional', 'count': 'Quantidade'},
-                            title="Grupos Populacionais por Estado (Bruto)",
-                            category_orders={'Pop': sorted(df['Pop'].dropna().unique())},
-                            text_auto=True)
-        fig5.update_traces(textposition='auto', texttemplate='%{y}', textfont=dict(color='#000000'))
-        fig5.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Grupos Populacionais por Estado (Bruto)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Grupo Populacional", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Quantidade", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig5, use_container_width=True)
-
-    with col6:
-        st.markdown("#### Tipo de Exposição (Bruto)")
-        fig6 = px.histogram(df, x='tipo_exposicao', color='UF_UDM', barmode='group',
-                            labels={'tipo_exposicao': 'Tipo de Exposição', 'count': 'Quantidade'},
-                            title="Tipo de Exposição por Estado (Bruto)",
-                            text_auto=True)
-        fig6.update_traces(textposition='auto', texttemplate='%{y}', textfont=dict(color='#000000'))
-        fig6.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="#000000"),
-            title=dict(text="Tipo de Exposição por Estado (Bruto)", font=dict(color="#000000")),
-            xaxis=dict(title=dict(text="Tipo de Exposição", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Quantidade", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig6, use_container_width=True)
-
-    # Download de dados filtrados
-    st.subheader("Exportar Dados")
-    st.markdown(download_csv(df, "dados_filtrados_pep"), unsafe_allow_html=True)
-
-# Página PrEP
-elif menu == "🔒 PrEP":
-    st.title("📊 Análise Comparativa da Dispersão de PrEP - BA x RJ")
-    st.warning("Os dados foram coletados pela **Agência Nacional de Saúde (ANS)** e representam 80% de registros do RJ e apenas 20% da BA, o que pode impactar as comparações. Use os dados da BA com cautela devido ao tamanho limitado da amostra.")
-    st.markdown("""
-    🔗 **Fonte dos Dados**: [PrEP - Profilaxia Pré-Exposição ao HIV](https://www.gov.br/aids/pt-br/indicadores-epidemiologicos/painel-de-monitoramento/painel-prep)
-    """, unsafe_allow_html=True)
-
-    # Definir intervalo de datas com base nos dados PrEP
-    df = carregar_dados_prep(data_inicio, data_fim, estados)
-    if df is None or df.empty:
+    if metadados and metadados["linhas"] == 0:
+        st.error(f"O arquivo de dados {dados.ABAS[chave_pagina]['nome']} está vazio.")
+        instrumentacao.finalizar_execucao()
+        st.stop()
+    total_registros = int(totais.sum())
+    if total_registros == 0:
         st.warning("Nenhum dado disponível com os filtros selecionados.")
+        instrumentacao.finalizar_execucao()
         st.stop()
 
-    # Métricas resumidas
+    # Métricas resumidas: total geral e um cartão por UF selecionada, em linhas de até 6
     st.subheader("Resumo dos Dados")
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        total_registros = len(df)
-        st.markdown(f"<div class='metric-card'><strong>Total de Registros</strong><br>{total_registros}</div>", unsafe_allow_html=True)
-    with col2:
-        total_ba = len(df[df['UF_UDM'] == 'BA'])
-        percent_ba = round((total_ba / total_registros * 100), 2) if total_registros > 0 else 0
-        st.markdown(f"<div class='metric-card'><strong>Total BA</strong><br>{total_ba} ({percent_ba}%)</div>", unsafe_allow_html=True)
-    with col3:
-        total_rj = len(df[df['UF_UDM'] == 'RJ'])
-        percent_rj = round((total_rj / total_registros * 100), 2) if total_registros > 0 else 0
-        st.markdown(f"<div class='metric-card'><strong>Total RJ</strong><br>{total_rj} ({percent_rj}%)</div>", unsafe_allow_html=True)
-
-    st.subheader("Visualizações (Percentuais)")
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("#### Tipo de Serviço de Atendimento")
-        fig1 = px.histogram(df, x='tp_servico_atendimento', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            labels={'tp_servico_atendimento': 'Tipo de Serviço', 'count': 'Percentual'},
-                            title="Tipo de Serviço por Estado (Percentual)",
-                            text_auto=True)
-        fig1.update_traces(textposition='auto', texttemplate='%{y:.2f}%')
-        fig1.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="Tipo de Serviço", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig1, use_container_width=True)
-
-    with col2:
-        st.markdown("#### Tipo de Esquema PrEP")
-        fig2 = px.histogram(df, x='tp_esquema_prep', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            labels={'tp_esquema_prep': 'Esquema PrEP', 'count': 'Percentual'},
-                            title="Esquema PrEP por Estado (Percentual)",
-                            text_auto=True)
-        fig2.update_traces(textposition='auto', texttemplate='%{y:.2f}%')
-        fig2.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="Esquema PrEP", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig2, use_container_width=True)
-
-    col3, col4 = st.columns(2)
-    with col3:
-        st.markdown("#### Tipo de Testagem HIV")
-        fig3 = px.histogram(df, x='tp_testagem_hiv', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            title="Testagem HIV por Estado (Percentual)",
-                            labels={'tp_testagem_hiv': 'Testagem HIV', 'count': 'Percentual'},
-                            text_auto=True)
-        fig3.update_traces(textposition='auto', texttemplate='%{y:.2f}%')
-        fig3.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="Testagem HIV", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig3, use_container_width=True)
-
-    with col4:
-        st.markdown("#### IST Autorrelatada")
-        fig4 = px.histogram(df, x='IST_autorrelato', color='UF_UDM', barmode='group',
-                            histnorm='percent',
-                            title="IST Autorrelatada por Estado (Percentual)",
-                            labels={'IST_autorrelato': 'IST Autorrelatada', 'count': 'Percentual'},
-                            text_auto=True)
-        fig4.update_traces(textposition='auto', texttemplate='%{y:.2f}%')
-        fig4.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="IST Autorrelatada", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Percentual", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig4, use_container_width=True)
-
-    # Visualizações com valores brutos
-    st.subheader("Visualizações (Valores Brutos)")
-    col5, col6 = st.columns(2)
-    with col5:
-        st.markdown("#### Tipo de Serviço de Atendimento (Bruto)")
-        fig5 = px.histogram(df, x='tp_servico_atendimento', color='UF_UDM', barmode='group',
-                            labels={'tp_servico_atendimento': 'Tipo de Serviço', 'count': 'Quantidade'},
-                            title="Tipo de Serviço por Estado (Bruto)",
-                            text_auto=True)
-        fig5.update_traces(textposition='auto', texttemplate='%{y}')
-        fig5.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="Tipo de Serviço", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Quantidade", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig5, use_container_width=True)
-
-    with col6:
-        st.markdown("#### Tipo de Esquema PrEP (Bruto)")
-        fig6 = px.histogram(df, x='tp_esquema_prep', color='UF_UDM', barmode='group',
-                            labels={'tp_esquema_prep': 'Esquema PrEP', 'count': 'Quantidade'},
-                            title="Esquema PrEP por Estado (Bruto)",
-                            text_auto=True)
-        fig6.update_traces(textposition='auto', texttemplate='%{y}')
-        fig6.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color="#000000",
-            xaxis=dict(title=dict(text="Esquema PrEP", font=dict(color="#000000")), tickfont=dict(color="#000000")),
-            yaxis=dict(title=dict(text="Quantidade", font=dict(color="#000000")), tickfont=dict(color="#000000"))
-        )
-        st.plotly_chart(fig6, use_container_width=True)
-
-    # Download de dados filtrados
-    st.subheader("Exportar Dados")
-    st.markdown(download_csv(df, "dados_filtrados_prep"), unsafe_allow_html=True)
\ No newline at end of file
+    cartoes = [("Total de Registros", f"{total_registros}")]
+    for uf, total_uf in totais.items():
+        percent_uf = round((int(total_uf) / total_registros * 100), 2)
+        cartoes.append((f"Total {uf}", f"{int(total_uf)} ({percent_uf}%)"))
+    for inicio in range(0, len(cartoes), 6):
+        for coluna, (rotulo, valor) in zip(st.columns(6), cartoes[inicio:inicio + 6]):
+            with coluna:
+                st.markdown(f"<div class='metric-card'><strong>{rotulo}</strong><br>{valor}</div>", unsafe_allow_html=True)
+
+    # Seções da página em fragmentos: um widget de uma seção reexecuta só aquela seção
+    secao_visualizacoes(chave_pagina, versao, data_inicio, data_fim, estados, relatorio)
+    secao_evolucao(chave_pagina, versao, data_inicio, data_fim, estados, relatorio)
+    secao_exportacao(chave_pagina, versao, data_inicio, data_fim, estados)
+
+instrumentacao.finalizar_execucao()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import consulta
+import cubo
+import dados
+import exportacao
+import graficos
+import series
+
+# Limite de linhas de uma planilha do Excel: tamanhos maiores pulam a etapa de leitura do .xlsx
+LIMITE_LINHAS_EXCEL = 1_048_575
+
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Valores sintéticos de cada coluna categórica, no esquema real das abas
+VALORES = {
+    'UF_UDM': (['BA', 'RJ'], [0.1, 0.9]),
+    'Pop': (['Gays e outros HSH', 'Mulheres trans', 'Homens trans', 'Travestis', 'Pessoas não binárias',
+             'Profissionais do sexo', 'Mulheres cis', 'Homens heterossexuais cis'], None),
+    'tipo_exposicao': (['Relação sexual consentida', 'Violência sexual', 'Acidente com material biológico'], [0.8, 0.1, 0.1]),
+    'trabalho_sexual': (['Sim', 'Não', None], [0.1, 0.8, 0.1]),
+    'alcool_drogas': (['Sim', 'Não', None], [0.3, 0.6, 0.1]),
+    'tp_servico_atendimento': (['Público', 'Privado'], [0.85, 0.15]),
+    'tp_esquema_prep': (['Diária', 'Sob demanda'], [0.9, 0.1]),
+    'tp_testagem_hiv': (['Teste rápido', 'Laboratorial', None], [0.7, 0.25, 0.05]),
+    'IST_autorrelato': (['Sim', 'Não', None], [0.15, 0.8, 0.05]),
+}
+
+
+# Função para gerar uma aba sintética com n linhas e as colunas de dados.ABAS[chave]
+def gerar_aba(chave, n, semente=0, data_inicial="2018-01-01", dias=365 * 7):
+    rng = np.random.default_rng(semente)
+    colunas = {}
+    for coluna in dados.ABAS[chave]["colunas"]:
+        if coluna == 'dt_disp':
+            colunas[coluna] = pd.Timestamp(data_inicial) + pd.to_timedelta(rng.integers(0, dias, n), unit='D')
+        else:
+            valores, pesos = VALORES[coluna]
+            colunas[coluna] = np.array(valores, dtype=object)[rng.choice(len(valores), n, p=pesos)]
+    return pd.DataFrame(colunas)
+
+
+# Função para medir uma etapa, repetindo-a e guardando a mediana dos tempos
+def medir(resultados, aba, linhas, etapa, funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    registro = {"aba": aba, "linhas": linhas, "etapa": etapa,
+                "segundos": statistics.median(tempos), "segundos_min": min(tempos), "repeticoes": repeticoes}
+    resultados.append(registro)
+    print(f"{aba:>5} {linhas:>11,} {etapa:<22} {registro['segundos']:10.4f}s", flush=True)
+    return saida, registro
+
+
+# Função para executar todas as etapas do pipeline de uma aba com n linhas
+def executar(chave, n, pasta, repeticoes, limite_excel, resultados):
+    df = gerar_aba(chave, n)
+    config = dados.ABAS[chave]
+
+    if n <= limite_excel:
+        caminho_xlsx = os.path.join(pasta, f"{chave}_{n}.xlsx")
+        with pd.ExcelWriter(caminho_xlsx) as escritor:
+            df.to_excel(escritor, sheet_name=config["aba"], index=False)
+        medir(resultados, chave, n, "leitura_excel", lambda: dados.ler_aba_excel(chave, caminho_xlsx), 1)
+
+    datas_texto = df['dt_disp'].dt.strftime("%Y-%m-%d %H:%M:%S")
+    medir(resultados, chave, n, "conversao_datas", lambda: pd.to_datetime(datas_texto, errors='coerce'), repeticoes)
+
+    tipado = df.copy()
+    for coluna in config["colunas"]:
+        if coluna != 'dt_disp':
+            tipado[coluna] = tipado[coluna].astype("string").astype("category")
+    caminho_parquet = os.path.join(pasta, f"{chave}_{n}.parquet")
+    medir(resultados, chave, n, "escrita_colunar", lambda: tipado.to_parquet(caminho_parquet, index=False), 1)
+    lido, _ = medir(resultados, chave, n, "leitura_colunar", lambda: pd.read_parquet(caminho_parquet), repeticoes)
+
+    base = lido.dropna(subset=['dt_disp', 'UF_UDM']).sort_values('dt_disp', kind='stable').reset_index(drop=True)
+    data_fim = base['dt_disp'].max().date()
+    data_inicio = (base['dt_disp'].max() - pd.Timedelta(days=365)).date()
+    estados = list(base['UF_UDM'].cat.categories[:1])
+
+    # Armazenamento do app (partições, segmentos mapeáveis e cubo) em uma pasta temporária,
+    # sem planilha de origem: os leitores recebem caminho=None e usam o que foi ingerido
+    dados.PASTA_CACHE = os.path.join(pasta, f"cache_{chave}_{n}")
+    medir(resultados, chave, n, "ingestao", lambda: dados.ingerir(chave, df, "benchmark"), 1)
+    segmentos, _ = medir(resultados, chave, n, "mapeamento",
+                         lambda: dados.mapear_linhas(chave, estados[0], None), repeticoes)
+    filtrado, registro = medir(resultados, chave, n, "filtro",
+                               lambda: list(dados.lotes(dados.fatiar(segmentos, data_inicio, data_fim), chave, None)),
+                               repeticoes)
+    registro["linhas_saida"] = sum(len(lote) for lote in filtrado)
+    if consulta.duckdb is not None:
+        linhas_duckdb, registro = medir(
+            resultados, chave, n, "filtro_duckdb",
+            lambda: sum(len(lote) for lote in consulta.linhas(chave, data_inicio, data_fim, estados, None)), repeticoes)
+        registro["linhas_saida"] = linhas_duckdb
+
+    contagens, _ = medir(resultados, chave, n, "montagem_cubo",
+                         lambda: cubo.montar_cubo(base, dados.dimensoes(chave)), 1)
+    todos = list(contagens["ufs"])
+    tabelas, _ = medir(resultados, chave, n, "agregacao",
+                       lambda: cubo.distribuicoes(contagens, graficos.dimensoes_pagina(chave), data_inicio, data_fim, todos),
+                       repeticoes)
+
+    medir(resultados, chave, n, "serie_temporal",
+          lambda: graficos.figura_serie(series.reamostrar(cubo.serie_diaria(contagens, None, None, todos), "Diária"),
+                                        "", 'UF_UDM'),
+          repeticoes)
+
+    especificacoes = graficos.PAGINAS[chave]["graficos"]
+    figuras, _ = medir(resultados, chave, n, "figuras",
+                       lambda: [graficos.figura(grafico, tabelas[grafico["dimensao"]]) for grafico in especificacoes],
+                       repeticoes)
+    tamanho_json, registro = medir(resultados, chave, n, "serializacao_figuras",
+                                   lambda: sum(len(fig.to_json().encode("utf-8")) for fig in figuras), repeticoes)
+    registro["bytes"] = tamanho_json
+
+    arquivo, registro = medir(resultados, chave, n, "exportacao_csv",
+                              lambda: exportacao.exportar(filtrado, "CSV (gzip)"), 1)
+    registro["bytes"] = len(arquivo)
+    verificar_download(filtrado[0])
+
+
+# Função para conferir que o arquivo exportado, em cada formato, é aceito pelo
+# st.download_button quando gerado no clique (o que a renderização da página não exercita)
+def verificar_download(tabela):
+    from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+    for formato in exportacao.FORMATOS:
+        arquivo = exportacao.exportar(tabela.iloc[:1000], formato)
+        convertido, _ = convert_data_to_bytes_and_infer_mime(
+            arquivo, RuntimeError(f"Exportação em {formato} devolveu um tipo que o download não aceita: {type(arquivo)}"))
+        if not convertido:
+            raise RuntimeError(f"Exportação em {formato} gerou um arquivo vazio")
+
+
+# Função para comparar com uma execução anterior e listar etapas que ficaram mais lentas
+def comparar(resultados, caminho_anterior, tolerancia):
+    with open(caminho_anterior, encoding="utf-8") as f:
+        anteriores = {(r["aba"], r["linhas"], r["etapa"]): r for r in json.load(f)["resultados"]}
+    regressoes = []
+    for atual in resultados:
+        anterior = anteriores.get((atual["aba"], atual["linhas"], atual["etapa"]))
+        if anterior and anterior["segundos"] > 0 and atual["segundos"] > anterior["segundos"] * (1 + tolerancia):
+            regressoes.append((atual, anterior))
+    for atual, anterior in regressoes:
+        print(f"REGRESSÃO {atual['aba']} {atual['linhas']:,} {atual['etapa']}: "
+              f"{anterior['segundos']:.4f}s -> {atual['segundos']:.4f}s")
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline PEP/PrEP com planilhas sintéticas.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO, help="quantidades de linhas")
+    parser.add_argument("--abas", nargs="+", default=list(dados.ABAS), choices=list(dados.ABAS))
+    parser.add_argument("--repeticoes", type=int, default=3, help="repetições das etapas rápidas (usa a mediana)")
+    parser.add_argument("--limite-excel", type=int, default=100_000,
+                        help="maior tamanho para o qual a etapa de leitura do .xlsx é executada")
+    parser.add_argument("--saida", default="benchmark_resultados.json", help="arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="aumento relativo aceito antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    limite_excel = min(args.limite_excel, LIMITE_LINHAS_EXCEL)
+    with tempfile.TemporaryDirectory() as pasta:
+        for n in args.tamanhos:
+            for chave in args.abas:
+                executar(chave, n, pasta, args.repeticoes, limite_excel, resultados)
+
+    saida = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar and comparar(resultados, args.comparar, args.tolerancia):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
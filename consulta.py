@@ -0,0 +1,174 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import cubo
+import dados
+
+# Backend de consulta do painel, escolhido por DASHBOARD_BACKEND:
+#   pandas  (padrão) bases por UF em memória e cubo de contagens acumuladas
+#   duckdb  consultas direto nas partições em Parquet: os filtros de período e UF e as
+#           contagens por categoria rodam no DuckDB, e só o resultado chega ao pandas
+# O DuckDB é opcional (pip install duckdb); sem ele, o painel segue com o pandas.
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKENDS = ("pandas", "duckdb")
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas").lower()
+
+# Limite de memória do DuckDB (ex.: "512MB"); acima dele o motor usa disco temporário
+MEMORIA_DUCKDB = os.environ.get("DASHBOARD_DUCKDB_MEMORIA")
+
+# Quantidade de linhas lidas do DuckDB por vez ao trazer as linhas filtradas
+TAMANHO_LOTE = 100_000
+
+
+# Função para escolher o backend em uso: devolve o backend e, quando o pedido não pode
+# ser atendido, uma mensagem explicando a troca para o pandas
+def backend_ativo(backend=None):
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        return "pandas", f"Backend de consulta desconhecido: {backend}. Usando pandas."
+    if backend == "duckdb" and duckdb is None:
+        return "pandas", "DuckDB não está instalado. Usando pandas."
+    return backend, None
+
+
+def _conectar():
+    conexao = duckdb.connect()
+    if MEMORIA_DUCKDB:
+        conexao.execute(f"SET memory_limit = '{MEMORIA_DUCKDB}'")
+    return conexao
+
+
+# Função para montar a origem e o filtro de uma consulta sobre as partições da aba. O
+# filtro em `uf` (coluna da partição) faz o DuckDB ler apenas as pastas dos estados
+# selecionados; o de dt_disp usa as estatísticas de cada arquivo Parquet.
+def _consulta(chave, data_inicio, data_fim, estados, caminho):
+    pasta = dados.preparar_cache(chave, caminho)
+    arquivos = os.path.join(pasta, "*", "*", "*.parquet")
+    if not glob.glob(arquivos) or not estados:
+        return None
+    origem = (f"read_parquet('{arquivos}', hive_partitioning = true, "
+              "hive_types = {'mes': VARCHAR, 'uf': VARCHAR})")
+    parametros = {f"uf{i}": uf for i, uf in enumerate(estados)}
+    condicoes = [f"uf IN ({', '.join('$' + nome for nome in parametros)})", "dt_disp IS NOT NULL"]
+    if data_inicio is not None:
+        condicoes.append("dt_disp >= $inicio")
+        parametros["inicio"] = pd.Timestamp(data_inicio).to_pydatetime()
+    if data_fim is not None:
+        condicoes.append("dt_disp < $fim")
+        parametros["fim"] = (pd.Timestamp(data_fim) + pd.Timedelta(days=1)).to_pydatetime()
+    return origem, " AND ".join(condicoes), parametros
+
+
+# Função para obter o total de registros por UF no período, no mesmo formato de
+# cubo.totais_por_uf (UFs conhecidas e selecionadas, em ordem alfabética, com zeros)
+def totais_por_uf(chave, data_inicio, data_fim, estados, caminho=dados.ARQUIVO_DADOS):
+    selecionados = set(estados)
+    ufs = [uf for uf in dados.ler_metadados(chave, caminho)["ufs"] if uf in selecionados]
+    consulta = _consulta(chave, data_inicio, data_fim, ufs, caminho)
+    contagens = {}
+    if consulta:
+        origem, condicoes, parametros = consulta
+        with _conectar() as conexao:
+            contagens = dict(conexao.execute(
+                f"SELECT UF_UDM, count(*) FROM {origem} WHERE {condicoes} GROUP BY UF_UDM", parametros).fetchall())
+    return pd.Series([contagens.get(uf, 0) for uf in ufs], index=pd.Index(ufs, dtype=object),
+                     name="Quantidade", dtype="int64")
+
+
+# Função para montar a tabela de distribuição de várias dimensões, no mesmo formato de
+# cubo.distribuicoes. As contagens por (UF, valor) de todas as dimensões saem de uma única
+# consulta agrupada (GROUPING SETS), e só essas contagens chegam ao pandas.
+def distribuicoes(chave, dimensoes, data_inicio, data_fim, estados, caminho=dados.ARQUIVO_DADOS):
+    selecionados = set(estados)
+    ufs = [uf for uf in dados.ler_metadados(chave, caminho)["ufs"] if uf in selecionados]
+    consulta = _consulta(chave, data_inicio, data_fim, ufs, caminho)
+    contagens = pd.DataFrame(columns=["dimensao", "UF_UDM", "valor", "Quantidade"])
+    if consulta and dimensoes:
+        origem, condicoes, parametros = consulta
+        colunas = ", ".join(f'"{dimensao}"' for dimensao in dimensoes)
+        conjuntos = ", ".join(f'(UF_UDM, "{dimensao}")' for dimensao in dimensoes)
+        # GROUPING(<dimensao>) = 0 indica o conjunto agrupado por aquela dimensão
+        dimensao_do_grupo = " ".join(f"WHEN GROUPING(\"{dimensao}\") = 0 THEN '{dimensao}'" for dimensao in dimensoes)
+        valor_do_grupo = " ".join(f'WHEN GROUPING("{dimensao}") = 0 THEN CAST("{dimensao}" AS VARCHAR)'
+                                  for dimensao in dimensoes)
+        with _conectar() as conexao:
+            contagens = conexao.execute(
+                f"SELECT CASE {dimensao_do_grupo} END AS dimensao, UF_UDM, CASE {valor_do_grupo} END AS valor, "
+                f"count(*) AS Quantidade FROM (SELECT UF_UDM, {colunas} FROM {origem} WHERE {condicoes}) "
+                f"GROUP BY GROUPING SETS ({conjuntos})", parametros).df()
+    contagens = contagens.dropna(subset=["valor"])
+    tabelas = {}
+    for dimensao in dimensoes:
+        grupo = contagens.loc[contagens["dimensao"] == dimensao]
+        tabela = grupo.pivot_table(index="valor", columns="UF_UDM", values="Quantidade", aggfunc="sum", fill_value=0)
+        tabela = tabela.reindex(index=sorted(tabela.index, key=str), columns=ufs, fill_value=0).astype("int64")
+        tabela.index = pd.Index(np.array(tabela.index, dtype=str), name=dimensao)
+        tabela.columns = pd.Index(np.array(ufs, dtype=str), name="UF_UDM")
+        tabelas[dimensao] = cubo.tabela_distribuicao(tabela, dimensao)
+    return tabelas
+
+
+# Função para obter as contagens diárias do período, no mesmo formato de cubo.serie_diaria:
+# o DuckDB agrupa por dia e por UF (ou valor da dimensão), e só essas contagens chegam ao pandas
+def serie_diaria(chave, data_inicio, data_fim, estados, dimensao=None, caminho=dados.ARQUIVO_DADOS):
+    metadados = dados.ler_metadados(chave, caminho)
+    selecionados = set(estados)
+    ufs = [uf for uf in metadados["ufs"] if uf in selecionados]
+    coluna = 'UF_UDM' if dimensao is None else dimensao
+    contagens = pd.DataFrame(columns=["dia", "serie", "Quantidade"])
+    consulta = _consulta(chave, data_inicio, data_fim, ufs, caminho)
+    if consulta:
+        origem, condicoes, parametros = consulta
+        with _conectar() as conexao:
+            contagens = conexao.execute(
+                f'SELECT CAST(dt_disp AS DATE) AS dia, CAST("{coluna}" AS VARCHAR) AS serie, count(*) AS Quantidade '
+                f'FROM {origem} WHERE {condicoes} AND "{coluna}" IS NOT NULL GROUP BY ALL', parametros).df()
+    if metadados["data_min"]:
+        primeiro = pd.Timestamp(metadados["data_min"]).normalize()
+        ultimo = pd.Timestamp(metadados["data_max"]).normalize()
+        if data_inicio is not None:
+            primeiro = max(primeiro, pd.Timestamp(data_inicio))
+        if data_fim is not None:
+            ultimo = min(ultimo, pd.Timestamp(data_fim))
+        datas = pd.date_range(primeiro, ultimo, freq="D")
+    else:
+        datas = pd.DatetimeIndex([])
+    serie = contagens.pivot_table(index="dia", columns="serie", values="Quantidade", aggfunc="sum", fill_value=0)
+    serie.index = pd.DatetimeIndex(serie.index)
+    nomes = ufs if dimensao is None else sorted(serie.columns, key=str)
+    serie = serie.reindex(index=datas, columns=nomes, fill_value=0).astype("int64")
+    serie.index = pd.DatetimeIndex(serie.index.astype("datetime64[s]"), name='dt_disp', freq='D')
+    serie.columns = pd.Index(nomes, dtype=object, name=coluna)
+    return serie.loc[:, serie.sum(axis=0) > 0]
+
+
+# Função para ler as linhas filtradas de uma aba em lotes (DataFrames com os mesmos tipos de
+# dados.lotes). O DuckDB lê só as partições e os row groups do filtro e entrega o
+# resultado em lotes do Arrow, convertidos um a um para o pandas à medida que chegam: a
+# memória usada é a de um lote, e os lotes vão direto para o exportador, sem serem juntados.
+# Sempre sai ao menos um lote (vazio, se nada passar no filtro).
+def linhas(chave, data_inicio, data_fim, estados, caminho=dados.ARQUIVO_DADOS):
+    colunas = dados.ABAS[chave]["colunas"]
+    consulta = _consulta(chave, data_inicio, data_fim, estados, caminho)
+    if consulta is None:
+        yield from dados.lotes([], chave, caminho)
+        return
+    origem, condicoes, parametros = consulta
+    selecao = ", ".join(f'"{coluna}"' for coluna in colunas)
+    with _conectar() as conexao:
+        leitor = conexao.execute(
+            f"SELECT {selecao} FROM {origem} WHERE {condicoes} ORDER BY UF_UDM, dt_disp", parametros
+        ).fetch_record_batch(TAMANHO_LOTE)
+        vazio = True
+        for lote in leitor:
+            vazio = False
+            yield dados.categorias_globais(dados.tipar(lote.to_pandas(), chave), chave, caminho)
+        if vazio:
+            yield dados.categorias_globais(dados.tipar(leitor.schema.empty_table().to_pandas(), chave), chave, caminho)
@@ -0,0 +1,257 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+# Cubo de contagens por (dia, UF, dimensão, valor), guardado como somas acumuladas
+# ao longo dos dias: a contagem de qualquer período é acumulado[fim] - acumulado[inicio].
+
+
+# Função para transformar contagens diárias em somas acumuladas (com uma linha de zeros no início)
+def _acumular(contagens):
+    acumulado = np.zeros((contagens.shape[0] + 1,) + contagens.shape[1:], dtype=np.int64)
+    np.cumsum(contagens, axis=0, out=acumulado[1:])
+    return acumulado
+
+
+# Função para converter uma coluna em categórica com apenas as categorias presentes, em ordem alfabética
+def _categorias_ordenadas(coluna):
+    coluna = coluna.astype("category").cat.remove_unused_categories()
+    categorias = coluna.cat.categories
+    return coluna.cat.reorder_categories(sorted(categorias, key=str)) if len(categorias) else coluna
+
+
+# Função para montar o cubo a partir das linhas tipadas de uma aba
+def montar_cubo(df, dimensoes):
+    validos = df.dropna(subset=['dt_disp', 'UF_UDM'])
+    ufs = _categorias_ordenadas(validos['UF_UDM'])
+    nomes_ufs = np.array([str(uf) for uf in ufs.cat.categories])
+    n_ufs = len(nomes_ufs)
+    dias = validos['dt_disp'].to_numpy().astype('datetime64[D]')
+    if len(dias):
+        dia_inicial = dias.min()
+        n_dias = int((dias.max() - dia_inicial).astype(np.int64)) + 1
+    else:
+        dia_inicial = np.datetime64('1970-01-01', 'D')
+        n_dias = 0
+    celula = (dias - dia_inicial).astype(np.int64) * n_ufs + ufs.cat.codes.to_numpy()
+
+    total = np.bincount(celula, minlength=n_dias * n_ufs).reshape(n_dias, n_ufs)
+    cubo = {"dia_inicial": dia_inicial, "ufs": nomes_ufs, "total": _acumular(total), "dimensoes": {}}
+    for dimensao in dimensoes:
+        coluna = _categorias_ordenadas(validos[dimensao])
+        valores = np.array([str(v) for v in coluna.cat.categories])
+        codigos = coluna.cat.codes.to_numpy()
+        presentes = codigos >= 0
+        contagens = np.bincount(celula[presentes] * len(valores) + codigos[presentes],
+                                minlength=n_dias * n_ufs * len(valores)).reshape(n_dias, n_ufs, len(valores))
+        cubo["dimensoes"][dimensao] = {"valores": valores, "acumulado": _acumular(contagens)}
+    return cubo
+
+
+def _n_dias(cubo):
+    return cubo["total"].shape[0] - 1
+
+
+# Função para reposicionar contagens diárias em eixos maiores (dias, UFs e valores)
+def _reindexar(diarias, deslocamento, n_dias, posicoes_ufs, n_ufs, posicoes_valores=None, n_valores=None):
+    forma = (n_dias, n_ufs) if posicoes_valores is None else (n_dias, n_ufs, n_valores)
+    saida = np.zeros(forma, dtype=np.int64)
+    eixos = [np.arange(deslocamento, deslocamento + diarias.shape[0]), posicoes_ufs]
+    if posicoes_valores is not None:
+        eixos.append(posicoes_valores)
+    saida[np.ix_(*eixos)] = diarias
+    return saida
+
+
+# Função para atualizar o cubo apenas nas partições (mês, UF) afetadas por uma ingestão.
+# `linhas` deve conter todas as linhas dessas partições (antigas e novas): as células delas
+# são zeradas no cubo atual e substituídas pelas contagens recalculadas (partições
+# removidas não têm linhas). O custo depende do tamanho das partições afetadas e do cubo,
+# não do histórico de linhas.
+def atualizar_cubo(atual, linhas, particoes, dimensoes):
+    novo = montar_cubo(linhas, dimensoes)
+    if atual is None or _n_dias(atual) == 0:
+        return novo
+
+    # Sem linhas recalculadas (partições apenas removidas), o eixo de dias é o do cubo atual
+    com_dias = [cubo for cubo in (atual, novo) if _n_dias(cubo) > 0]
+    dia_inicial = min(cubo["dia_inicial"] for cubo in com_dias)
+    dia_final = max(cubo["dia_inicial"] + _n_dias(cubo) for cubo in com_dias)
+    n_dias = int((dia_final - dia_inicial).astype(np.int64))
+    ufs = np.array(sorted(set(atual["ufs"]) | set(novo["ufs"])))
+    posicao_uf = {uf: i for i, uf in enumerate(ufs)}
+
+    def reposicionar(cubo, acumulado, valores=None, todos_valores=None):
+        deslocamento = int((cubo["dia_inicial"] - dia_inicial).astype(np.int64))
+        posicoes_ufs = [posicao_uf[uf] for uf in cubo["ufs"]]
+        if valores is None:
+            return _reindexar(np.diff(acumulado, axis=0), deslocamento, n_dias, posicoes_ufs, len(ufs))
+        posicao_valor = {valor: i for i, valor in enumerate(todos_valores)}
+        return _reindexar(np.diff(acumulado, axis=0), deslocamento, n_dias, posicoes_ufs, len(ufs),
+                          [posicao_valor[valor] for valor in valores], len(todos_valores))
+
+    # Intervalos de dias (no novo eixo) e UF de cada partição afetada
+    celulas = []
+    for mes, uf in particoes:
+        inicio_mes = np.datetime64(mes, 'M')
+        inicio = int((inicio_mes.astype('datetime64[D]') - dia_inicial).astype(np.int64))
+        fim = int(((inicio_mes + 1).astype('datetime64[D]') - dia_inicial).astype(np.int64))
+        celulas.append((slice(max(inicio, 0), max(min(fim, n_dias), 0)), posicao_uf[uf]))
+
+    total = reposicionar(atual, atual["total"])
+    for dias, uf in celulas:
+        total[dias, uf] = 0
+    if _n_dias(novo):
+        total += reposicionar(novo, novo["total"])
+    resultado = {"dia_inicial": dia_inicial, "ufs": ufs, "total": _acumular(total), "dimensoes": {}}
+
+    for dimensao in dimensoes:
+        antigo, recalculado = atual["dimensoes"][dimensao], novo["dimensoes"][dimensao]
+        valores = np.array(sorted(set(antigo["valores"]) | set(recalculado["valores"])))
+        diarias = reposicionar(atual, antigo["acumulado"], antigo["valores"], valores)
+        for dias, uf in celulas:
+            diarias[dias, uf, :] = 0
+        if _n_dias(novo):
+            diarias += reposicionar(novo, recalculado["acumulado"], recalculado["valores"], valores)
+        resultado["dimensoes"][dimensao] = {"valores": valores, "acumulado": _acumular(diarias)}
+    return resultado
+
+
+# Função para montar o índice de metadados (período, UFs, linhas por UF e por mês e valores
+# de cada coluna categórica) a partir do cubo, sem ler as linhas
+def metadados(cubo):
+    diarias = np.diff(cubo["total"], axis=0)
+    por_dia = diarias.sum(axis=1)
+    dias_com_dados = np.flatnonzero(por_dia)
+    if len(dias_com_dados) == 0:
+        return {"data_min": None, "data_max": None, "linhas": 0, "ufs": [],
+                "linhas_por_uf": {}, "linhas_por_mes": {}, "valores": {}}
+    datas = cubo["dia_inicial"] + np.arange(len(por_dia))
+    por_mes = pd.Series(por_dia, index=datas.astype('datetime64[M]').astype(str)).groupby(level=0).sum()
+    totais_ufs = cubo["total"][-1]
+    ufs = [str(uf) for uf, n in zip(cubo["ufs"], totais_ufs) if n > 0]
+    valores = {'UF_UDM': ufs}
+    for dimensao, dados_dimensao in cubo["dimensoes"].items():
+        totais_valores = dados_dimensao["acumulado"][-1].sum(axis=0)
+        valores[dimensao] = [str(v) for v, n in zip(dados_dimensao["valores"], totais_valores) if n > 0]
+    return {
+        "data_min": str(datas[dias_com_dados[0]]),
+        "data_max": str(datas[dias_com_dados[-1]]),
+        "linhas": int(por_dia.sum()),
+        "ufs": ufs,
+        "linhas_por_uf": {str(uf): int(n) for uf, n in zip(cubo["ufs"], totais_ufs) if n > 0},
+        "linhas_por_mes": {mes: int(n) for mes, n in por_mes.items() if n > 0},
+        "valores": valores,
+    }
+
+
+# Função para gravar o cubo em um arquivo Arrow IPC sem compressão: uma única linha com uma
+# coluna (lista de int64) por array, e eixos, UFs e valores nos metadados do esquema
+def gravar_cubo(cubo, caminho):
+    arrays = {"total": cubo["total"]}
+    descricao = {"dia_inicial": str(cubo["dia_inicial"]), "ufs": [str(uf) for uf in cubo["ufs"]], "valores": {}}
+    for dimensao, dados_dimensao in cubo["dimensoes"].items():
+        arrays[f"acumulado__{dimensao}"] = dados_dimensao["acumulado"]
+        descricao["valores"][dimensao] = [str(valor) for valor in dados_dimensao["valores"]]
+    descricao["formas"] = {nome: list(array.shape) for nome, array in arrays.items()}
+    colunas = {
+        nome: pa.LargeListArray.from_arrays([0, array.size], pa.array(np.ascontiguousarray(array, dtype=np.int64).reshape(-1)))
+        for nome, array in arrays.items()
+    }
+    tabela = pa.table(colunas).replace_schema_metadata({"cubo": json.dumps(descricao, ensure_ascii=False)})
+    with pa.OSFile(caminho, "wb") as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+
+
+# Função para ler um cubo gravado por gravar_cubo. O arquivo é mapeado em memória e os
+# arrays são visões somente leitura sobre ele, sem cópia: processos que leem o mesmo
+# arquivo compartilham as mesmas páginas do cache do sistema operacional.
+def ler_cubo(caminho):
+    tabela = pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+    descricao = json.loads(tabela.schema.metadata[b"cubo"])
+
+    def array(nome):
+        valores = tabela.column(nome).chunk(0).values.to_numpy(zero_copy_only=True)
+        return valores.reshape(descricao["formas"][nome])
+
+    cubo = {"dia_inicial": np.datetime64(descricao["dia_inicial"], 'D'), "ufs": np.array(descricao["ufs"]),
+            "total": array("total"), "dimensoes": {}}
+    for dimensao, valores in descricao["valores"].items():
+        cubo["dimensoes"][dimensao] = {"valores": np.array(valores), "acumulado": array(f"acumulado__{dimensao}")}
+    return cubo
+
+
+# Função para converter o período em índices do eixo de dias (fim exclusivo)
+def _indices(cubo, data_inicio, data_fim):
+    n_dias = cubo["total"].shape[0] - 1
+    inicio = 0 if data_inicio is None else int((np.datetime64(data_inicio, 'D') - cubo["dia_inicial"]).astype(np.int64))
+    fim = n_dias if data_fim is None else int((np.datetime64(data_fim, 'D') - cubo["dia_inicial"]).astype(np.int64)) + 1
+    inicio = min(max(inicio, 0), n_dias)
+    fim = min(max(fim, inicio), n_dias)
+    return inicio, fim
+
+
+def _posicoes_ufs(cubo, estados):
+    selecionados = set(estados)
+    return [i for i, uf in enumerate(cubo["ufs"]) if uf in selecionados]
+
+
+# Função para obter o total de registros por UF no período
+def totais_por_uf(cubo, data_inicio, data_fim, estados):
+    inicio, fim = _indices(cubo, data_inicio, data_fim)
+    posicoes = _posicoes_ufs(cubo, estados)
+    totais = cubo["total"][fim, posicoes] - cubo["total"][inicio, posicoes]
+    return pd.Series(totais, index=cubo["ufs"][posicoes], name="Quantidade")
+
+
+def _contagens(cubo, dimensao, inicio, fim, posicoes):
+    dados_dimensao = cubo["dimensoes"][dimensao]
+    acumulado = dados_dimensao["acumulado"]
+    matriz = acumulado[fim][posicoes] - acumulado[inicio][posicoes]
+    return pd.DataFrame(matriz.T, index=pd.Index(dados_dimensao["valores"], name=dimensao),
+                        columns=pd.Index(cubo["ufs"][posicoes], name='UF_UDM'))
+
+
+# Função para converter as contagens de uma dimensão (linhas = valores, colunas = UFs) na
+# tabela longa de distribuição, com quantidade e percentual dentro de cada UF
+def tabela_distribuicao(tabela, dimensao):
+    tabela = tabela.loc[tabela.sum(axis=1) > 0]
+    totais = tabela.sum(axis=0)
+    percentual = tabela.div(totais.where(totais > 0), axis=1) * 100
+    longa = tabela.stack().rename("Quantidade").to_frame()
+    longa["Percentual"] = percentual.stack()
+    longa = longa.reset_index()
+    # Mantém a ordem das UFs como séries e omite UFs sem registros
+    return longa.loc[longa['UF_UDM'].map(totais) > 0].sort_values(['UF_UDM', dimensao], kind='stable').reset_index(drop=True)
+
+
+# Função para montar, em uma única passada pelo cubo, a tabela de distribuição de várias
+# dimensões (quantidade e percentual dentro de cada UF)
+def distribuicoes(cubo, dimensoes, data_inicio, data_fim, estados):
+    inicio, fim = _indices(cubo, data_inicio, data_fim)
+    posicoes = _posicoes_ufs(cubo, estados)
+    return {
+        dimensao: tabela_distribuicao(_contagens(cubo, dimensao, inicio, fim, posicoes), dimensao)
+        for dimensao in dimensoes
+    }
+
+
+# Função para obter as contagens diárias do período (índice de datas), com uma coluna por
+# UF ou, com `dimensao`, uma coluna por valor da dimensão somando as UFs selecionadas.
+# Séries sem registros no período são omitidas.
+def serie_diaria(cubo, data_inicio, data_fim, estados, dimensao=None):
+    inicio, fim = _indices(cubo, data_inicio, data_fim)
+    posicoes = _posicoes_ufs(cubo, estados)
+    if dimensao is None:
+        diarias = np.diff(cubo["total"][inicio:fim + 1][:, posicoes], axis=0)
+        nomes = pd.Index(cubo["ufs"][posicoes], name='UF_UDM')
+    else:
+        dados_dimensao = cubo["dimensoes"][dimensao]
+        diarias = np.diff(dados_dimensao["acumulado"][inicio:fim + 1][:, posicoes].sum(axis=1), axis=0)
+        nomes = pd.Index(dados_dimensao["valores"], name=dimensao)
+    datas = pd.DatetimeIndex(cubo["dia_inicial"] + np.arange(inicio, fim), name='dt_disp', freq='D')
+    serie = pd.DataFrame(diarias, index=datas, columns=nomes)
+    return serie.loc[:, serie.sum(axis=0) > 0]
@@ -0,0 +1,517 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+import cubo
+
+# Trava entre processos (fcntl no Linux/macOS, msvcrt no Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Planilha de origem e pasta onde fica o armazenamento colunar de cada aba
+ARQUIVO_DADOS = os.path.join("data", "data.xlsx")
+PASTA_CACHE = os.path.join("data", "cache")
+
+# Quantidade aproximada de linhas de cada lote de linhas filtradas convertido para o pandas
+# (ver lotes): limita a memória usada ao exportar, sem converter segmento por segmento
+TAMANHO_LOTE = 100_000
+
+# Abas da planilha, com as colunas usadas pelo painel
+ABAS = {
+    "pep": {
+        "nome": "PEP",
+        "aba": "Banco_PEP_UDM",
+        "colunas": ['dt_disp', 'UF_UDM', 'Pop', 'tipo_exposicao', 'trabalho_sexual', 'alcool_drogas'],
+    },
+    "prep": {
+        "nome": "PrEP",
+        "aba": "Banco_PrEP_UDM",
+        "colunas": ['dt_disp', 'UF_UDM', 'tp_servico_atendimento', 'tp_esquema_prep', 'tp_testagem_hiv', 'IST_autorrelato'],
+    },
+}
+
+
+# Função para calcular o hash SHA-256 da planilha em blocos
+def _hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+# Pasta com as partições de uma aba: <chave>/mes=AAAA-MM/uf=XX/parte.parquet
+def _pasta_particoes(chave):
+    return os.path.join(PASTA_CACHE, chave)
+
+
+def _caminho_particao(chave, mes, uf):
+    return os.path.join(_pasta_particoes(chave), f"mes={mes}", f"uf={uf}", "parte.parquet")
+
+
+def _caminho_manifesto(chave):
+    return os.path.join(PASTA_CACHE, f"{chave}.json")
+
+
+def _caminho_metadados(chave):
+    return os.path.join(PASTA_CACHE, f"{chave}.meta.json")
+
+
+def _caminho_cubo(chave):
+    return os.path.join(PASTA_CACHE, f"{chave}.cubo.arrow")
+
+
+# Pasta com uma cópia de cada partição em Arrow IPC sem compressão, ordenada por dt_disp,
+# para leitura mapeada em memória: <chave>.mapas/uf=XX/mes=AAAA-MM.arrow. Os segmentos
+# seguem as partições (mês, UF), de modo que uma ingestão regrava só os das partições afetadas.
+def _pasta_mapas(chave):
+    return os.path.join(PASTA_CACHE, f"{chave}.mapas")
+
+
+def _caminho_mapa(chave, uf, mes):
+    return os.path.join(_pasta_mapas(chave), f"uf={uf}", f"mes={mes}.arrow")
+
+
+def _caminho_trava(chave):
+    return os.path.join(PASTA_CACHE, f"{chave}.lock")
+
+
+def _artefatos(chave):
+    return [_pasta_particoes(chave), _pasta_mapas(chave), _caminho_metadados(chave), _caminho_cubo(chave)]
+
+
+# Colunas categóricas de uma aba usadas nos gráficos (todas exceto data e UF)
+def dimensoes(chave):
+    return [coluna for coluna in ABAS[chave]["colunas"] if coluna not in ('dt_disp', 'UF_UDM')]
+
+
+def _ler_manifesto(chave):
+    try:
+        with open(_caminho_manifesto(chave), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Função para nomear o arquivo temporário de uma gravação: oculto (ignorado pelos leitores
+# das partições) e único por gravação
+def _temporario(caminho, lote):
+    pasta, nome = os.path.split(caminho)
+    return os.path.join(pasta, f".{nome}.{lote}.tmp")
+
+
+# Abas travadas pela thread atual, para que as funções que travam possam chamar umas às outras
+_travadas = threading.local()
+
+
+# Função para travar o armazenamento de uma aba entre processos e threads (réplicas do app,
+# sessões do Streamlit, preparar.py, relatorios.py): só um por vez ingere, conclui ou apaga
+# o armazenamento da aba. Os leitores não travam: cada arquivo é trocado de uma vez.
+@contextmanager
+def _trava(chave):
+    chaves = _travadas.__dict__.setdefault("chaves", set())
+    if chave in chaves:
+        yield
+        return
+    os.makedirs(PASTA_CACHE, exist_ok=True)
+    with open(_caminho_trava(chave), "a+b") as arquivo:
+        if fcntl:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+        else:
+            arquivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        chaves.add(chave)
+        try:
+            yield
+        finally:
+            chaves.discard(chave)
+            if fcntl:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+            else:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _gravar_json(caminho, conteudo):
+    temporario = _temporario(caminho, uuid.uuid4().hex[:12])
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(conteudo, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+# Função para identificar a versão da planilha (mtime, tamanho e hash).
+# O hash só é recalculado quando mtime ou tamanho mudam em relação ao manifesto.
+def versao_planilha(chave, caminho=ARQUIVO_DADOS):
+    stat = os.stat(caminho)
+    manifesto = _ler_manifesto(chave)
+    origem = manifesto.get("origem") if manifesto else None
+    if origem and origem["mtime_ns"] == stat.st_mtime_ns and origem["tamanho"] == stat.st_size:
+        return origem
+    return {"mtime_ns": stat.st_mtime_ns, "tamanho": stat.st_size, "sha256": _hash_arquivo(caminho)}
+
+
+# Função para tipar as colunas de uma aba (datas e categorias)
+def tipar(df, chave):
+    df = df[ABAS[chave]["colunas"]].copy()
+    df['dt_disp'] = pd.to_datetime(df['dt_disp'], errors='coerce').astype('datetime64[us]')
+    for coluna in ABAS[chave]["colunas"]:
+        if coluna != 'dt_disp':
+            df[coluna] = df[coluna].astype("string").astype("category")
+    return df
+
+
+# Função para ler uma aba da planilha e tipar as colunas
+def ler_aba_excel(chave, caminho=ARQUIVO_DADOS):
+    config = ABAS[chave]
+    return tipar(pd.read_excel(caminho, sheet_name=config["aba"], usecols=config["colunas"]), chave)
+
+
+# Função para calcular uma chave por linha que distingue linhas repetidas: (hash do
+# conteúdo, ordem da ocorrência). Assim, dispensações idênticas legítimas não são perdidas
+# na deduplicação: só entram as ocorrências que excedem as já armazenadas.
+def _chaves_linhas(df):
+    if df.empty:
+        return pd.MultiIndex.from_arrays([[], []])
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    ocorrencias = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([hashes, ocorrencias])
+
+
+# Função para gravar o segmento mapeável de uma partição (linhas já ordenadas por dt_disp)
+def _gravar_mapa(particao, caminho):
+    tabela = pa.Table.from_pandas(particao, preserve_index=False).combine_chunks()
+    with pa.OSFile(caminho, "wb") as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+
+
+# Função para listar as partições (mês, UF) armazenadas de uma aba
+def _particoes_armazenadas(chave):
+    particoes = []
+    for arquivo in glob.glob(os.path.join(_pasta_particoes(chave), "mes=*", "uf=*", "parte.parquet")):
+        pasta_uf = os.path.dirname(arquivo)
+        particoes.append((os.path.basename(os.path.dirname(pasta_uf))[4:], os.path.basename(pasta_uf)[3:]))
+    return sorted(particoes)
+
+
+# Função para apagar um arquivo do armazenamento e até `niveis` pastas acima dele que
+# ficarem vazias
+def _remover(caminho, niveis):
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    pasta = os.path.dirname(caminho)
+    for _ in range(niveis):
+        try:
+            os.rmdir(pasta)
+        except OSError:
+            break
+        pasta = os.path.dirname(pasta)
+
+
+# Função para concluir a ingestão registrada como pendente no manifesto. A ingestão grava
+# tudo em arquivos temporários e só então registra no manifesto as trocas a fazer (o ponto
+# de confirmação); se o processo parar durante as trocas, elas são refeitas aqui. Os
+# temporários de uma ingestão que não chegou a ser confirmada são descartados.
+def _concluir_pendente(chave):
+    manifesto = _ler_manifesto(chave)
+    pendente = manifesto.get("pendente") if manifesto else None
+    if pendente:
+        for temporario, definitivo in pendente["trocas"]:
+            if os.path.exists(temporario):
+                os.replace(temporario, definitivo)
+        for caminho, niveis in pendente["remocoes"]:
+            _remover(caminho, niveis)
+        del manifesto["pendente"]
+        _gravar_json(_caminho_manifesto(chave), manifesto)
+
+    orfaos = [os.path.join(raiz, nome)
+              for pasta in (_pasta_particoes(chave), _pasta_mapas(chave))
+              for raiz, _, nomes in os.walk(pasta) for nome in nomes if nome.startswith(".") and nome.endswith(".tmp")]
+    if os.path.isdir(PASTA_CACHE):
+        orfaos += [os.path.join(PASTA_CACHE, nome) for nome in os.listdir(PASTA_CACHE)
+                   if nome.startswith(f".{chave}.") and nome.endswith(".tmp")]
+    for orfao in orfaos:
+        os.remove(orfao)
+
+
+# Função para ingerir um extrato no armazenamento particionado por mês e UF. Só as linhas
+# ainda não armazenadas são gravadas, e só as partições que receberam linhas novas são
+# reescritas; o cubo e os metadados são atualizados apenas nessas partições.
+# Com `substituir`, o extrato é o conteúdo completo da aba (caso de data.xlsx): cada partição
+# passa a ter exatamente as linhas dele, as que não mudaram ficam como estão e as que não
+# existem mais nele são removidas, de modo que linhas apagadas ou corrigidas não permanecem.
+# Partições, segmentos mapeáveis, cubo e metadados são gravados em temporários e só
+# trocados depois que o manifesto registra a ingestão (ver _concluir_pendente).
+def ingerir(chave, extrato, identificacao, substituir=False, origem=None):
+    with _trava(chave):
+        return _ingerir(chave, extrato, identificacao, substituir, origem)
+
+
+def _ingerir(chave, extrato, identificacao, substituir, origem):
+    _concluir_pendente(chave)
+    extrato = tipar(extrato, chave).dropna(subset=['dt_disp', 'UF_UDM'])
+    manifesto = _ler_manifesto(chave) or {"aba": ABAS[chave]["aba"], "versao": "", "linhas": 0, "extratos": []}
+    lote = uuid.uuid4().hex[:12]
+    os.makedirs(_pasta_particoes(chave), exist_ok=True)
+
+    meses = extrato['dt_disp'].dt.strftime("%Y-%m")
+    afetadas, linhas_afetadas, trocas, remocoes, cobertas = [], [], [], [], set()
+    linhas_novas = linhas_removidas = 0
+    for (mes, uf), novas in extrato.groupby([meses, extrato['UF_UDM'].astype(str)], observed=True, sort=True):
+        cobertas.add((mes, uf))
+        caminho_particao = _caminho_particao(chave, mes, uf)
+        existentes = tipar(pd.read_parquet(caminho_particao), chave) if os.path.exists(caminho_particao) else None
+        if existentes is None:
+            particao, adicionadas, removidas = novas, len(novas), 0
+        elif substituir:
+            chaves_novas, chaves_existentes = _chaves_linhas(novas), _chaves_linhas(existentes)
+            adicionadas = int((~chaves_novas.isin(chaves_existentes)).sum())
+            removidas = int((~chaves_existentes.isin(chaves_novas)).sum())
+            particao = novas
+        else:
+            novas = novas.loc[~_chaves_linhas(novas).isin(_chaves_linhas(existentes))]
+            particao, adicionadas, removidas = pd.concat([existentes, novas], ignore_index=True), len(novas), 0
+        if adicionadas == 0 and removidas == 0:
+            continue
+        particao = tipar(particao, chave).sort_values('dt_disp', kind='stable')
+        caminho_mapa = _caminho_mapa(chave, uf, mes)
+        for caminho in (caminho_particao, caminho_mapa):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        particao.to_parquet(_temporario(caminho_particao, lote), index=False)
+        _gravar_mapa(particao, _temporario(caminho_mapa, lote))
+        trocas += [(_temporario(caminho_particao, lote), caminho_particao), (_temporario(caminho_mapa, lote), caminho_mapa)]
+        afetadas.append((mes, uf))
+        linhas_afetadas.append(particao)
+        linhas_novas += adicionadas
+        linhas_removidas += removidas
+
+    if substituir:
+        for mes, uf in _particoes_armazenadas(chave):
+            if (mes, uf) not in cobertas:
+                caminho_particao = _caminho_particao(chave, mes, uf)
+                linhas_removidas += pq.read_metadata(caminho_particao).num_rows
+                remocoes += [(caminho_particao, 2), (_caminho_mapa(chave, uf, mes), 1)]
+                afetadas.append((mes, uf))
+
+    caminho_cubo = _caminho_cubo(chave)
+    if afetadas or not os.path.exists(caminho_cubo):
+        atual = cubo.ler_cubo(caminho_cubo) if os.path.exists(caminho_cubo) else None
+        linhas = pd.concat(linhas_afetadas, ignore_index=True) if linhas_afetadas else tipar(extrato.iloc[:0], chave)
+        novo_cubo = cubo.atualizar_cubo(atual, linhas, afetadas, dimensoes(chave))
+        cubo.gravar_cubo(novo_cubo, _temporario(caminho_cubo, lote))
+        trocas.append((_temporario(caminho_cubo, lote), caminho_cubo))
+        metadados = cubo.metadados(novo_cubo)
+        with open(_temporario(_caminho_metadados(chave), lote), "w", encoding="utf-8") as f:
+            json.dump(metadados, f, ensure_ascii=False, indent=2)
+        trocas.append((_temporario(_caminho_metadados(chave), lote), _caminho_metadados(chave)))
+        manifesto["linhas"] = metadados["linhas"]
+
+    if afetadas:
+        manifesto["versao"] = hashlib.sha256(f"{manifesto['versao']}:{identificacao}".encode()).hexdigest()[:16]
+    if origem:
+        manifesto["origem"] = origem
+    manifesto["extratos"].append({"extrato": identificacao, "substituicao": substituir, "linhas_novas": linhas_novas,
+                                  "linhas_removidas": linhas_removidas, "particoes": len(afetadas),
+                                  "em": datetime.now().isoformat(timespec="seconds")})
+    os.makedirs(_pasta_mapas(chave), exist_ok=True)
+    manifesto["pendente"] = {"lote": lote, "trocas": trocas, "remocoes": remocoes}
+    _gravar_json(_caminho_manifesto(chave), manifesto)
+    _concluir_pendente(chave)
+    return {"linhas_novas": linhas_novas, "linhas_removidas": linhas_removidas, "particoes": afetadas}
+
+
+# Função para ingerir um novo extrato (.xlsx com as mesmas abas de data.xlsx) em todas as abas presentes nele
+def ingerir_extrato(caminho_extrato):
+    identificacao = _hash_arquivo(caminho_extrato)
+    abas_presentes = set(pd.ExcelFile(caminho_extrato).sheet_names)
+    return {
+        chave: ingerir(chave, ler_aba_excel(chave, caminho_extrato), identificacao)
+        for chave, config in ABAS.items() if config["aba"] in abas_presentes
+    }
+
+
+# Função para apagar o armazenamento de uma aba (para reconstruí-lo do zero)
+def limpar(chave):
+    with _trava(chave):
+        shutil.rmtree(_pasta_particoes(chave), ignore_errors=True)
+        shutil.rmtree(_pasta_mapas(chave), ignore_errors=True)
+        # Arquivos mapeáveis do formato anterior (um por UF)
+        shutil.rmtree(os.path.join(PASTA_CACHE, f"{chave}.ipc"), ignore_errors=True)
+        for caminho in (_caminho_manifesto(chave), _caminho_metadados(chave), _caminho_cubo(chave)):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+
+# Função para manter o armazenamento em dia com a planilha. data.xlsx é a fonte completa
+# de cada aba: quando ela muda, substitui o conteúdo armazenado, reescrevendo só as
+# partições (mês, UF) que mudaram e removendo as que não existem mais nela.
+# Com o armazenamento em dia (o caso de toda execução do app), nada é travado nem gravado.
+# Sem planilha de origem (`caminho` None), usa o armazenamento como está, alimentado só
+# por extratos (ex.: no benchmark).
+def preparar_cache(chave, caminho=ARQUIVO_DADOS):
+    if caminho is not None and not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo '{caminho}' não encontrado no servidor.")
+    manifesto = _ler_manifesto(chave)
+    completo = manifesto and "pendente" not in manifesto and all(os.path.exists(artefato) for artefato in _artefatos(chave))
+    if completo and (caminho is None or manifesto.get("origem") == versao_planilha(chave, caminho)):
+        return _pasta_particoes(chave)
+
+    with _trava(chave):
+        # Outro processo pode ter concluído o trabalho enquanto esperávamos a trava
+        _concluir_pendente(chave)
+        if caminho is None:
+            return _pasta_particoes(chave)
+        origem = versao_planilha(chave, caminho)
+        manifesto = _ler_manifesto(chave)
+        if manifesto and all(os.path.exists(artefato) for artefato in _artefatos(chave)):
+            if manifesto.get("origem", {}).get("sha256") == origem["sha256"]:
+                # Conteúdo igual (ex.: arquivo apenas copiado): atualiza só o mtime
+                if manifesto["origem"] != origem:
+                    manifesto["origem"] = origem
+                    _gravar_json(_caminho_manifesto(chave), manifesto)
+                return _pasta_particoes(chave)
+        elif manifesto:
+            # Armazenamento incompleto (ou de um formato anterior): reconstrói do zero
+            limpar(chave)
+
+        ingerir(chave, ler_aba_excel(chave, caminho), origem["sha256"], substituir=True, origem=origem)
+    return _pasta_particoes(chave)
+
+
+# Função para ler o índice de metadados sem carregar os dados da aba
+def ler_metadados(chave, caminho=ARQUIVO_DADOS):
+    preparar_cache(chave, caminho)
+    with open(_caminho_metadados(chave), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Função para obter a versão dos dados armazenados de uma aba, que muda a cada ingestão
+# com linhas novas (usada como chave dos caches do app)
+def versao_dados(chave, caminho=ARQUIVO_DADOS):
+    preparar_cache(chave, caminho)
+    return _ler_manifesto(chave)["versao"]
+
+
+# Função para verificar, sem reconstruir nada, se o cache de uma aba corresponde à planilha atual
+def cache_atualizado(chave, caminho=ARQUIVO_DADOS):
+    manifesto = _ler_manifesto(chave)
+    if not manifesto or not all(os.path.exists(artefato) for artefato in _artefatos(chave)):
+        return False
+    return manifesto.get("origem", {}).get("sha256") == versao_planilha(chave, caminho)["sha256"]
+
+
+# Função para preparar o cache de todas as abas. As abas desatualizadas são convertidas
+# em paralelo, uma por processo; devolve a lista das que foram reconstruídas.
+def preparar_todas(caminho=ARQUIVO_DADOS, processos=None):
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo '{caminho}' não encontrado no servidor.")
+    pendentes = [chave for chave in ABAS if not cache_atualizado(chave, caminho)]
+    if len(pendentes) > 1 and processos != 1:
+        # "spawn" evita herdar, via fork, as threads do servidor do Streamlit
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processos or len(pendentes), mp_context=contexto) as executor:
+            list(executor.map(preparar_cache, pendentes, [caminho] * len(pendentes)))
+    for chave in ABAS:
+        preparar_cache(chave, caminho)
+    return pendentes
+
+
+# Função para ler o cubo de contagens acumuladas de uma aba
+def ler_cubo(chave, caminho=ARQUIVO_DADOS):
+    preparar_cache(chave, caminho)
+    return cubo.ler_cubo(_caminho_cubo(chave))
+
+
+# Função para mapear em memória as linhas de uma UF: lista de (mês, tabela), em ordem de
+# mês, vazia se a UF não tem linhas. Cada tabela é uma visão somente leitura sobre o segmento,
+# sem cópia: processos que mapeiam o mesmo arquivo compartilham as mesmas páginas do cache
+# do sistema operacional. O arquivo é fechado logo após o mapeamento (as tabelas mantêm a
+# região mapeada), para não prender um descritor por segmento.
+def mapear_linhas(chave, uf, caminho=ARQUIVO_DADOS):
+    preparar_cache(chave, caminho)
+    segmentos = []
+    for arquivo in sorted(glob.glob(os.path.join(_pasta_mapas(chave), f"uf={uf}", "mes=*.arrow"))):
+        try:
+            mapa = pa.memory_map(arquivo, "r")
+        except FileNotFoundError:
+            # Partição removida por uma ingestão em andamento
+            continue
+        segmentos.append((os.path.basename(arquivo)[4:-6], pa.ipc.open_file(mapa).read_all()))
+        mapa.close()
+    return segmentos
+
+
+# Função para dar às colunas categóricas as categorias de toda a aba, para que recortes de
+# UFs ou backends diferentes possam ser concatenados e comparados sem perder o tipo
+def categorias_globais(df, chave, caminho=ARQUIVO_DADOS):
+    return _aplicar_categorias(df, chave, ler_metadados(chave, caminho)["valores"])
+
+
+def _aplicar_categorias(df, chave, valores):
+    for coluna in ABAS[chave]["colunas"]:
+        if coluna != 'dt_disp':
+            df[coluna] = df[coluna].astype("category").cat.set_categories(valores.get(coluna, []))
+    return df
+
+
+# Função para recortar, entre data_inicio e data_fim (inclusive), as linhas de uma UF mapeadas
+# por mapear_linhas. Só os segmentos dos meses do período são usados, e só o primeiro e o
+# último deles, que podem estar parcialmente no período, passam por busca binária em dt_disp.
+# Devolve uma fatia do Arrow por segmento, sem cópia.
+def fatiar(segmentos, data_inicio, data_fim):
+    mes_inicio = None if data_inicio is None else pd.Timestamp(data_inicio).strftime("%Y-%m")
+    mes_fim = None if data_fim is None else pd.Timestamp(data_fim).strftime("%Y-%m")
+    no_periodo = [tabela for mes, tabela in segmentos or []
+                  if tabela.num_rows and (mes_inicio is None or mes >= mes_inicio) and (mes_fim is None or mes <= mes_fim)]
+    fatias = []
+    for indice, tabela in enumerate(no_periodo):
+        inicio, fim = 0, tabela.num_rows
+        if indice in (0, len(no_periodo) - 1):
+            datas = tabela.column('dt_disp').chunk(0).to_numpy(zero_copy_only=True)
+            if indice == 0 and data_inicio is not None:
+                inicio = int(np.searchsorted(datas, np.datetime64(pd.Timestamp(data_inicio)), side='left'))
+            if indice == len(no_periodo) - 1 and data_fim is not None:
+                fim = int(np.searchsorted(datas, np.datetime64(pd.Timestamp(data_fim) + pd.Timedelta(days=1)), side='left'))
+        if fim > inicio:
+            fatias.append(tabela.slice(inicio, fim - inicio))
+    return fatias
+
+
+# Função para converter as fatias de fatiar em DataFrames de cerca de `tamanho_lote` linhas
+# (fatias consecutivas são agrupadas até esse tamanho), um lote por vez, à medida que são
+# consumidos (ex.: pela exportação): só um lote fica no pandas de cada vez. Sempre sai ao
+# menos um DataFrame (vazio, se não há fatias), com as colunas e os tipos da aba.
+def lotes(fatias, chave, caminho=ARQUIVO_DADOS, tamanho_lote=TAMANHO_LOTE):
+    valores = ler_metadados(chave, caminho)["valores"]
+    pendentes, linhas, vazio = [], 0, True
+    for fatia in fatias:
+        pendentes.append(fatia)
+        linhas += fatia.num_rows
+        if linhas >= tamanho_lote:
+            yield _aplicar_categorias(pa.concat_tables(pendentes).to_pandas(), chave, valores)
+            pendentes, linhas, vazio = [], 0, False
+    if pendentes:
+        yield _aplicar_categorias(pa.concat_tables(pendentes).to_pandas(), chave, valores)
+    elif vazio:
+        yield _aplicar_categorias(tipar(pd.DataFrame(columns=ABAS[chave]["colunas"]), chave), chave, valores)
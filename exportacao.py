@@ -0,0 +1,83 @@
+import gzip
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Quantidade de linhas convertidas por vez: a memória usada na exportação depende
+# deste valor, e não do tamanho da tabela
+TAMANHO_BLOCO = 50_000
+
+# Acima deste tamanho o arquivo exportado sai da memória e vai para um temporário em disco
+LIMITE_MEMORIA = 16 * 1024 * 1024
+
+# Formatos oferecidos: rótulo -> (extensão, tipo MIME)
+FORMATOS = {
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+# Função para percorrer a tabela em blocos de até `tamanho_bloco` linhas. A tabela pode
+# ser um DataFrame ou uma sequência de DataFrames com as mesmas colunas (ex.: os lotes lidos
+# do DuckDB), percorrida sem juntá-los. O primeiro bloco sempre sai, mesmo vazio, para que
+# o cabeçalho e o esquema sejam gravados.
+def _blocos(tabela, tamanho_bloco):
+    partes = [tabela] if isinstance(tabela, pd.DataFrame) else tabela
+    primeiro = True
+    for parte in partes:
+        for inicio in range(0, max(len(parte), 1 if primeiro else 0), tamanho_bloco):
+            yield parte.iloc[inicio:inicio + tamanho_bloco]
+            primeiro = False
+
+
+# Função para gravar a tabela como CSV compactado com gzip, bloco a bloco
+def escrever_csv_gzip(df, destino, tamanho_bloco=TAMANHO_BLOCO):
+    with gzip.GzipFile(fileobj=destino, mode="wb", compresslevel=6) as arquivo:
+        # BOM para o Excel reconhecer UTF-8, como no export anterior (utf-8-sig)
+        arquivo.write("\ufeff".encode("utf-8"))
+        for indice, bloco in enumerate(_blocos(df, tamanho_bloco)):
+            arquivo.write(bloco.to_csv(index=False, header=indice == 0).encode("utf-8"))
+
+
+# Função para gravar a tabela como Parquet, um row group por bloco
+def escrever_parquet(df, destino, tamanho_bloco=TAMANHO_BLOCO):
+    arquivo = esquema = None
+    try:
+        for bloco in _blocos(df, tamanho_bloco):
+            if arquivo is None:
+                esquema = pa.Schema.from_pandas(bloco.iloc[:0], preserve_index=False)
+                arquivo = pq.ParquetWriter(destino, esquema, compression="zstd")
+            if len(bloco):
+                arquivo.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+    finally:
+        if arquivo is not None:
+            arquivo.close()
+
+
+# Função para exportar a tabela (um DataFrame ou uma sequência de DataFrames, ver _blocos)
+# no formato escolhido. O arquivo é gravado em um temporário, mantido em memória enquanto
+# for pequeno, e devolvido em bytes: é o que o st.download_button aceita de uma função
+# chamada no clique (ele copiaria o arquivo inteiro para a memória de qualquer forma).
+def exportar(df, formato, tamanho_bloco=TAMANHO_BLOCO):
+    with tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA) as destino:
+        if formato == "CSV (gzip)":
+            escrever_csv_gzip(df, destino, tamanho_bloco)
+        elif formato == "Parquet":
+            escrever_parquet(df, destino, tamanho_bloco)
+        else:
+            raise ValueError(f"Formato de exportação desconhecido: {formato}")
+        destino.seek(0)
+        return destino.read()
+
+
+# Função para juntar as tabelas agregadas de uma página (uma por dimensão) em uma única tabela
+def tabela_agregada(tabelas):
+    partes = [
+        tabela.rename(columns={dimensao: 'valor'}).assign(dimensao=dimensao)
+        for dimensao, tabela in tabelas.items()
+    ]
+    if not partes:
+        return pd.DataFrame(columns=['dimensao', 'valor', 'UF_UDM', 'Quantidade', 'Percentual'])
+    return pd.concat(partes, ignore_index=True)[['dimensao', 'valor', 'UF_UDM', 'Quantidade', 'Percentual']]
@@ -0,0 +1,147 @@
+import plotly.graph_objects as go
+
+import series
+
+COR_TEXTO = "#000000"
+
+# Registro declarativo das páginas de dados. Cada gráfico é descrito por:
+#   dimensao   coluna categórica da aba (deve estar em dados.ABAS[chave]["colunas"])
+#   rotulo     texto do eixo x
+#   cabecalho  subtítulo exibido acima do gráfico
+#   titulo     título da figura
+#   percentual True para percentual dentro de cada UF, False para valores brutos
+#   ordem      "alfabetica" (padrão) ou "quantidade" (categorias mais frequentes primeiro)
+# Incluir um gráfico ou uma nova página (com a aba correspondente em dados.ABAS)
+# é só acrescentar uma entrada aqui.
+PAGINAS = {
+    "pep": {
+        "menu": "💉 PEP",
+        "titulo": "📊 Análise Comparativa da Dispersão de PEP - BA x RJ",
+        "aviso": "Os dados foram coletados pela **Agência Nacional de Saúde (ANS)** e representam 90% de registros do RJ e apenas 10% da BA, o que pode impactar as comparações. Use os dados da BA com cautela devido ao tamanho limitado da amostra.",
+        "fonte": "🔗 **Fonte dos Dados**: [PEP - Profilaxia Pós-Exposição ao HIV](https://www.gov.br/aids/pt-br/indicadores-epidemiologicos/painel-de-monitoramento/painel-pep)",
+        "graficos": [
+            {"dimensao": 'Pop', "rotulo": "Grupo Populacional", "cabecalho": "Distribuição por Grupo Populacional",
+             "titulo": "Grupos Populacionais por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'tipo_exposicao', "rotulo": "Tipo de Exposição", "cabecalho": "Tipo de Exposição",
+             "titulo": "Tipo de Exposição por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'trabalho_sexual', "rotulo": "Trabalho Sexual", "cabecalho": "Trabalho Sexual",
+             "titulo": "Trabalho Sexual por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'alcool_drogas', "rotulo": "Álcool/Drogas", "cabecalho": "Uso de Álcool/Drogas",
+             "titulo": "Uso de Álcool/Drogas por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'Pop', "rotulo": "Grupo Populacional", "cabecalho": "Distribuição por Grupo Populacional (Bruto)",
+             "titulo": "Grupos Populacionais por Estado (Bruto)", "percentual": False},
+            {"dimensao": 'tipo_exposicao', "rotulo": "Tipo de Exposição", "cabecalho": "Tipo de Exposição (Bruto)",
+             "titulo": "Tipo de Exposição por Estado (Bruto)", "percentual": False},
+        ],
+    },
+    "prep": {
+        "menu": "🔒 PrEP",
+        "titulo": "📊 Análise Comparativa da Dispersão de PrEP - BA x RJ",
+        "aviso": "Os dados foram coletados pela **Agência Nacional de Saúde (ANS)** e representam 80% de registros do RJ e apenas 20% da BA, o que pode impactar as comparações. Use os dados da BA com cautela devido ao tamanho limitado da amostra.",
+        "fonte": "🔗 **Fonte dos Dados**: [PrEP - Profilaxia Pré-Exposição ao HIV](https://www.gov.br/aids/pt-br/indicadores-epidemiologicos/painel-de-monitoramento/painel-prep)",
+        "graficos": [
+            {"dimensao": 'tp_servico_atendimento', "rotulo": "Tipo de Serviço", "cabecalho": "Tipo de Serviço de Atendimento",
+             "titulo": "Tipo de Serviço por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'tp_esquema_prep', "rotulo": "Esquema PrEP", "cabecalho": "Tipo de Esquema PrEP",
+             "titulo": "Esquema PrEP por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'tp_testagem_hiv', "rotulo": "Testagem HIV", "cabecalho": "Tipo de Testagem HIV",
+             "titulo": "Testagem HIV por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'IST_autorrelato', "rotulo": "IST Autorrelatada", "cabecalho": "IST Autorrelatada",
+             "titulo": "IST Autorrelatada por Estado (Percentual)", "percentual": True},
+            {"dimensao": 'tp_servico_atendimento', "rotulo": "Tipo de Serviço", "cabecalho": "Tipo de Serviço de Atendimento (Bruto)",
+             "titulo": "Tipo de Serviço por Estado (Bruto)", "percentual": False},
+            {"dimensao": 'tp_esquema_prep', "rotulo": "Esquema PrEP", "cabecalho": "Tipo de Esquema PrEP (Bruto)",
+             "titulo": "Esquema PrEP por Estado (Bruto)", "percentual": False},
+        ],
+    },
+}
+
+
+# Função para listar, sem repetição, as dimensões usadas pelos gráficos de uma página
+def dimensoes_pagina(chave):
+    return list(dict.fromkeys(grafico["dimensao"] for grafico in PAGINAS[chave]["graficos"]))
+
+
+# Função para obter o rótulo de cada dimensão usada pelos gráficos de uma página
+def rotulos_dimensoes(chave):
+    rotulos = {}
+    for grafico in PAGINAS[chave]["graficos"]:
+        rotulos.setdefault(grafico["dimensao"], grafico["rotulo"])
+    return rotulos
+
+
+# Função para aplicar o tema claro usado em todos os gráficos do painel
+def aplicar_layout(fig, titulo, rotulo_x, rotulo_y):
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color=COR_TEXTO),
+        title=dict(text=titulo, font=dict(color=COR_TEXTO)),
+        xaxis=dict(title=dict(text=rotulo_x, font=dict(color=COR_TEXTO)), tickfont=dict(color=COR_TEXTO)),
+        yaxis=dict(title=dict(text=rotulo_y, font=dict(color=COR_TEXTO)), tickfont=dict(color=COR_TEXTO)),
+        barmode='group',
+        legend_title_text='UF_UDM',
+    )
+    return fig
+
+
+# Função para montar um gráfico de barras agrupadas por UF a partir da tabela agregada
+# (colunas UF_UDM, <dimensao>, Quantidade e Percentual). Cada UF vira um go.Bar com
+# apenas as categorias e os valores já calculados, sem as linhas de origem.
+def figura_barras(tabela, dimensao, rotulo, titulo, percentual, ordem="alfabetica"):
+    coluna = 'Percentual' if percentual else 'Quantidade'
+    fig = go.Figure()
+    for uf, grupo in tabela.groupby('UF_UDM', sort=False, observed=True):
+        valores = grupo[coluna].round(4) if percentual else grupo[coluna]
+        fig.add_trace(go.Bar(
+            name=str(uf),
+            x=grupo[dimensao].astype(str).tolist(),
+            y=valores.tolist(),
+            texttemplate='%{y:.2f}%' if percentual else '%{y}',
+            textposition='auto',
+            textfont=dict(color=COR_TEXTO),
+            hovertemplate=f"{rotulo}=%{{x}}<br>{coluna}=%{{y}}<extra>{uf}</extra>",
+        ))
+    if ordem == "quantidade":
+        categorias = tabela.groupby(dimensao, observed=True)['Quantidade'].sum().sort_values(ascending=False, kind='stable')
+        categorias = [str(categoria) for categoria in categorias.index]
+    else:
+        categorias = sorted(tabela[dimensao].astype(str).unique())
+    fig.update_xaxes(categoryorder='array', categoryarray=categorias)
+    return aplicar_layout(fig, titulo, rotulo, coluna)
+
+
+# Função para montar o gráfico descrito por uma entrada do registro
+def figura(grafico, tabela):
+    return figura_barras(tabela, grafico["dimensao"], grafico["rotulo"], grafico["titulo"],
+                         grafico["percentual"], grafico.get("ordem", "alfabetica"))
+
+
+# Função para montar o gráfico de linhas de uma série temporal (índice de datas, uma coluna
+# por UF ou por valor da dimensão). Cada série com mais de `limite_pontos` pontos é reduzida
+# por LTTB, de modo que o tamanho da figura não depende da extensão do período.
+def figura_serie(serie, titulo, rotulo_legenda, limite_pontos=series.LIMITE_PONTOS):
+    fig = go.Figure()
+    datas = serie.index.strftime("%Y-%m-%d").to_numpy()
+    posicoes = serie.index.asi8
+    for nome in serie.columns:
+        valores = serie[nome].to_numpy()
+        indices = series.lttb(posicoes, valores, limite_pontos)
+        fig.add_trace(go.Scatter(
+            name=str(nome),
+            x=datas[indices].tolist(),
+            y=valores[indices].tolist(),
+            mode='lines',
+            hovertemplate=f"%{{x}}<br>Quantidade=%{{y}}<extra>{nome}</extra>",
+        ))
+    aplicar_layout(fig, titulo, "Data", "Quantidade")
+    fig.update_layout(legend_title_text=rotulo_legenda, hovermode='x unified')
+    return fig
+
+
+# Função para montar o gráfico de evolução temporal de uma página a partir das contagens
+# diárias por UF (ou por valor de `dimensao`), reamostradas na frequência escolhida
+def figura_evolucao(chave, diaria, frequencia, dimensao=None):
+    rotulo = "UF_UDM" if dimensao is None else rotulos_dimensoes(chave)[dimensao]
+    titulo = f"Dispensações por {'Estado' if dimensao is None else rotulo} ({frequencia})"
+    return figura_serie(series.reamostrar(diaria, frequencia), titulo, rotulo)
@@ -0,0 +1,169 @@
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Instrumentação leve do caminho quente: cada execução (rerun) do script registra a duração
+# de suas etapas, com linhas de entrada/saída, bytes serializados e acertos de cache.
+# As últimas execuções ficam em memória para o painel de diagnóstico e cada uma é
+# emitida como uma linha JSON no logger "dashboard".
+
+MAXIMO_EXECUCOES = int(os.environ.get("DASHBOARD_INSTRUMENTACAO_N", "200"))
+
+logger = logging.getLogger("dashboard")
+if not logger.handlers:
+    _saida = logging.StreamHandler()
+    _saida.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_saida)
+    logger.setLevel(os.environ.get("DASHBOARD_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+_execucoes = collections.deque(maxlen=MAXIMO_EXECUCOES)
+_contadores_cache = collections.defaultdict(lambda: {"acertos": 0, "falhas": 0})
+_trava = threading.Lock()
+# Cada sessão do Streamlit executa o script em sua própria thread
+_local = threading.local()
+
+
+def _registrar_log(evento, conteudo, nivel=logging.INFO):
+    if logger.isEnabledFor(nivel):
+        logger.log(nivel, json.dumps({"evento": evento, **conteudo}, ensure_ascii=False, default=str))
+
+
+# Função para iniciar o registro de uma execução do script. Uma execução anterior que
+# não foi finalizada (ex.: interrompida por exceção) é encerrada antes.
+def iniciar_execucao(**contexto):
+    if getattr(_local, "execucao", None) is not None:
+        finalizar_execucao(interrompida=True)
+    _local.execucao = {
+        "inicio": datetime.now().isoformat(timespec="milliseconds"),
+        "relogio": time.perf_counter(),
+        "contexto": contexto,
+        "etapas": [],
+    }
+
+
+# Função para encerrar a execução atual, guardá-la no histórico e emiti-la no log
+def finalizar_execucao(interrompida=False):
+    execucao = getattr(_local, "execucao", None)
+    if execucao is None:
+        return
+    _local.execucao = None
+    execucao["segundos"] = time.perf_counter() - execucao.pop("relogio")
+    if interrompida:
+        execucao["interrompida"] = True
+    with _trava:
+        _execucoes.append(execucao)
+    _registrar_log("execucao", execucao)
+
+
+# Função para acrescentar dados de contexto (página, filtros) à execução atual
+def anotar(**contexto):
+    execucao = getattr(_local, "execucao", None)
+    if execucao is not None:
+        execucao["contexto"].update(contexto)
+
+
+# Gerenciador de contexto para as execuções parciais (fragmentos do Streamlit e funções
+# chamadas no clique de um download, que rodam em uma thread do servidor): quando o trecho
+# roda sozinho, sem a execução completa do script, ele é registrado como uma execução
+# própria; dentro de uma execução completa, vira apenas mais uma etapa.
+@contextlib.contextmanager
+def execucao_fragmento(nome, **contexto):
+    if getattr(_local, "execucao", None) is not None:
+        with etapa(f"fragmento:{nome}"):
+            yield
+        return
+    iniciar_execucao(fragmento=nome, **contexto)
+    try:
+        yield
+    finally:
+        finalizar_execucao()
+
+
+# Gerenciador de contexto para medir uma etapa. O dicionário devolvido pode receber
+# campos extras (linhas_entrada, linhas_saida, bytes...) dentro do bloco.
+@contextlib.contextmanager
+def etapa(nome, **campos):
+    registro = {"etapa": nome, **campos}
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        registro["segundos"] = time.perf_counter() - inicio
+        execucao = getattr(_local, "execucao", None)
+        if execucao is not None:
+            execucao["etapas"].append(registro)
+        _registrar_log("etapa", registro, logging.DEBUG)
+
+
+# Função para instrumentar uma função em cache do Streamlit, contando acertos e falhas.
+# Uso: carregar = cache_monitorado(st.cache_data(ttl=...), "carregar")(funcao)
+def cache_monitorado(decorador_cache, nome):
+    def decorar(funcao):
+        @functools.wraps(funcao)
+        def executar_falha(*args, **kwargs):
+            # Só roda quando o valor não está em cache
+            _local.falhas = getattr(_local, "falhas", 0) + 1
+            return funcao(*args, **kwargs)
+
+        em_cache = decorador_cache(executar_falha)
+
+        @functools.wraps(funcao)
+        def chamar(*args, **kwargs):
+            falhas_antes = getattr(_local, "falhas", 0)
+            with etapa(nome) as registro:
+                resultado = em_cache(*args, **kwargs)
+                acerto = getattr(_local, "falhas", 0) == falhas_antes
+                registro["cache"] = "acerto" if acerto else "falha"
+            with _trava:
+                _contadores_cache[nome]["acertos" if acerto else "falhas"] += 1
+            return resultado
+
+        chamar.clear = em_cache.clear
+        return chamar
+    return decorar
+
+
+# Função para resumir as últimas execuções: percentis de duração por etapa
+def resumo_etapas():
+    with _trava:
+        execucoes = list(_execucoes)
+    duracoes = collections.defaultdict(list)
+    for execucao in execucoes:
+        fragmento = execucao["contexto"].get("fragmento")
+        duracoes[f"(fragmento {fragmento})" if fragmento else "(execução completa)"].append(execucao["segundos"])
+        for registro in execucao["etapas"]:
+            duracoes[registro["etapa"]].append(registro["segundos"])
+    linhas = []
+    for nome, valores in duracoes.items():
+        p50, p90, p99 = np.percentile(valores, [50, 90, 99]) * 1000
+        linhas.append({"etapa": nome, "n": len(valores), "p50_ms": p50, "p90_ms": p90, "p99_ms": p99,
+                       "max_ms": max(valores) * 1000})
+    return pd.DataFrame(linhas, columns=["etapa", "n", "p50_ms", "p90_ms", "p99_ms", "max_ms"])
+
+
+# Função para listar os acertos e falhas de cada função em cache desde o início do servidor
+def resumo_cache():
+    with _trava:
+        contadores = {nome: dict(valores) for nome, valores in _contadores_cache.items()}
+    linhas = [
+        {"funcao": nome, **valores,
+         "taxa_acerto": valores["acertos"] / (valores["acertos"] + valores["falhas"])}
+        for nome, valores in contadores.items()
+    ]
+    return pd.DataFrame(linhas, columns=["funcao", "acertos", "falhas", "taxa_acerto"])
+
+
+# Função para obter as etapas da última execução finalizada
+def ultima_execucao():
+    with _trava:
+        return _execucoes[-1] if _execucoes else None
@@ -0,0 +1,51 @@
+import argparse
+import sys
+import time
+
+import dados
+
+
+# Comando para preparar o armazenamento colunar (partições Parquet, metadados e cubo) de
+# todas as abas antes de subir o painel, para que o primeiro acesso não espere a leitura
+# da planilha:
+#   python preparar.py && streamlit run app.py
+# Também ingere novos extratos de forma incremental (apenas as linhas novas são gravadas):
+#   python preparar.py --extrato extrato_2025_06.xlsx
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepara o armazenamento colunar das abas de data/data.xlsx.")
+    parser.add_argument("--arquivo", default=dados.ARQUIVO_DADOS, help="planilha de origem")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="processos usados na conversão (padrão: um por aba desatualizada)")
+    parser.add_argument("--extrato", nargs="+", default=[],
+                        help="extratos .xlsx a ingerir de forma incremental, na ordem dada")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="apaga o armazenamento e o reconstrói a partir da planilha de origem")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    if args.reconstruir:
+        for chave in dados.ABAS:
+            dados.limpar(chave)
+    try:
+        reconstruidas = dados.preparar_todas(args.arquivo, args.processos)
+    except FileNotFoundError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    duracao = time.perf_counter() - inicio
+    if reconstruidas:
+        print(f"Abas convertidas: {', '.join(reconstruidas)} ({duracao:.1f}s)")
+    else:
+        print(f"Cache já atualizado ({duracao:.2f}s)")
+
+    for extrato in args.extrato:
+        inicio = time.perf_counter()
+        resultado = dados.ingerir_extrato(extrato)
+        duracao = time.perf_counter() - inicio
+        for chave, ingestao in resultado.items():
+            print(f"{extrato} [{chave}]: {ingestao['linhas_novas']} linhas novas em "
+                  f"{len(ingestao['particoes'])} partições ({duracao:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+import plotly.io as pio
+
+import cubo
+import dados
+import exportacao
+import graficos
+
+# Pasta dos relatórios pré-gerados: <pasta>/<aba>/<versao>-<versao da página>/<UFs>/<inicio>_<fim>/
+PASTA_RELATORIOS = os.path.join("data", "relatorios")
+
+# Frequência da série temporal pré-gerada (a visão padrão da seção de evolução temporal)
+FREQUENCIA_SERIE = "Mensal"
+
+# Cubos já abertos por este processo (cada processo do pool abre o de cada aba uma vez)
+_cubos = {}
+
+
+# Função para calcular a versão do registro de uma página em graficos.PAGINAS: muda com
+# qualquer edição dos gráficos (ordem, títulos, ordenação, novos gráficos...)
+def versao_pagina(chave):
+    texto = json.dumps(graficos.PAGINAS[chave], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:12]
+
+
+# Pasta com os relatórios de uma aba para uma versão dos dados e do registro da página
+def pasta_versao(chave, versao):
+    return f"{versao}-{versao_pagina(chave)}"
+
+
+# Pasta do relatório de um filtro. As versões dos dados e do registro da página fazem parte
+# do caminho, de modo que relatórios de dados antigos ou com gráficos de um registro
+# anterior (ex.: reordenado ou com títulos alterados) nunca são servidos.
+def caminho_relatorio(chave, versao, data_inicio, data_fim, estados, pasta=PASTA_RELATORIOS):
+    return os.path.join(pasta, chave, pasta_versao(chave, versao), "-".join(sorted(set(estados))),
+                        f"{data_inicio}_{data_fim}")
+
+
+# Função para localizar o relatório pré-gerado de um filtro; devolve a pasta ou None
+def procurar(chave, versao, data_inicio, data_fim, estados, pasta=PASTA_RELATORIOS):
+    if not estados or data_inicio is None or data_fim is None:
+        return None
+    caminho = caminho_relatorio(chave, versao, data_inicio, data_fim, estados, pasta)
+    return caminho if os.path.exists(os.path.join(caminho, "resumo.json")) else None
+
+
+# Função para ler os totais por UF de um relatório, no formato de cubo.totais_por_uf
+def ler_totais(caminho):
+    with open(os.path.join(caminho, "resumo.json"), encoding="utf-8") as f:
+        totais = json.load(f)["totais"]
+    return pd.Series(list(totais.values()), index=pd.Index(list(totais), dtype=str), name="Quantidade", dtype="int64")
+
+
+# Função para ler um gráfico de um relatório. Devolve a figura e o tamanho do seu JSON em bytes.
+def ler_figura(caminho, nome):
+    with open(os.path.join(caminho, f"{nome}.json"), encoding="utf-8") as f:
+        texto = f.read()
+    return pio.from_json(texto), len(texto.encode("utf-8"))
+
+
+# Função para ler as tabelas agregadas de um relatório (formato de exportacao.tabela_agregada)
+def ler_tabelas(caminho):
+    return pd.read_parquet(os.path.join(caminho, "tabelas.parquet"))
+
+
+def _cubo(chave, arquivo):
+    if chave not in _cubos:
+        _cubos[chave] = dados.ler_cubo(chave, arquivo)
+    return _cubos[chave]
+
+
+# Função para montar a página HTML estática do relatório: métricas e todos os gráficos
+def _html(pagina, resumo, figuras):
+    linhas = "".join(
+        f"<tr><td>{html.escape(uf)}</td><td>{n}</td><td>{round(n / resumo['total'] * 100, 2) if resumo['total'] else 0}%</td></tr>"
+        for uf, n in resumo["totais"].items()
+    )
+    partes = [
+        f"<h1>{html.escape(pagina['titulo'])}</h1>",
+        f"<p>{html.escape(pagina['aviso'].replace('**', ''))}</p>",
+        f"<p>Período: {resumo['data_inicio']} a {resumo['data_fim']} | Estados: {', '.join(resumo['estados'])} | "
+        f"Gerado em {resumo['gerado_em']}</p>",
+        f"<h2>Resumo dos Dados</h2><p><strong>Total de Registros:</strong> {resumo['total']}</p>",
+        f"<table><tr><th>UF</th><th>Registros</th><th>%</th></tr>{linhas}</table>",
+    ]
+    for indice, fig in enumerate(figuras):
+        partes.append(pio.to_html(fig, full_html=False, include_plotlyjs="cdn" if indice == 0 else False))
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{''.join(partes)}</body></html>"
+
+
+# Função para gerar o relatório de uma aba para um filtro (UFs e período): resumo com os
+# totais, um JSON por gráfico da página (mais a série temporal), uma página HTML estática e
+# as tabelas agregadas em Parquet e CSV. O relatório é montado em uma pasta temporária e
+# publicado por _publicar; resumo.json é o último arquivo gravado.
+def gerar_relatorio(chave, versao, estados, data_inicio, data_fim, pasta=PASTA_RELATORIOS, arquivo=dados.ARQUIVO_DADOS):
+    contagens = _cubo(chave, arquivo)
+    pagina = graficos.PAGINAS[chave]
+    totais = cubo.totais_por_uf(contagens, data_inicio, data_fim, estados)
+    tabelas = cubo.distribuicoes(contagens, graficos.dimensoes_pagina(chave), data_inicio, data_fim, estados)
+    figuras = {f"grafico_{indice}": graficos.figura(grafico, tabelas[grafico["dimensao"]])
+               for indice, grafico in enumerate(pagina["graficos"])}
+    figuras["serie"] = graficos.figura_evolucao(
+        chave, cubo.serie_diaria(contagens, data_inicio, data_fim, estados), FREQUENCIA_SERIE)
+
+    destino = caminho_relatorio(chave, versao, data_inicio, data_fim, estados, pasta)
+    temporario = f"{destino}.{uuid.uuid4().hex[:12]}.tmp"
+    os.makedirs(temporario)
+    for nome, fig in figuras.items():
+        # Sem o template, que o plotly preenche ao ler: assim o Streamlit aplica o mesmo tema
+        # das figuras montadas no próprio app
+        conteudo = fig.to_plotly_json()
+        conteudo["layout"].pop("template", None)
+        with open(os.path.join(temporario, f"{nome}.json"), "w", encoding="utf-8") as f:
+            f.write(pio.to_json(conteudo, validate=False))
+    tabela = exportacao.tabela_agregada(tabelas)
+    tabela.to_parquet(os.path.join(temporario, "tabelas.parquet"), index=False)
+    with open(os.path.join(temporario, "tabelas.csv.gz"), "wb") as f:
+        exportacao.escrever_csv_gzip(tabela, f)
+    resumo = {
+        "aba": chave,
+        "versao": versao,
+        "versao_pagina": versao_pagina(chave),
+        "estados": sorted(set(estados)),
+        "data_inicio": str(data_inicio),
+        "data_fim": str(data_fim),
+        "total": int(totais.sum()),
+        "totais": {str(uf): int(n) for uf, n in totais.items()},
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(temporario, "relatorio.html"), "w", encoding="utf-8") as f:
+        f.write(_html(pagina, resumo, list(figuras.values())))
+    with open(os.path.join(temporario, "resumo.json"), "w", encoding="utf-8") as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    _publicar(temporario, destino)
+    return destino
+
+
+# Função para colocar o relatório montado em `temporario` no lugar de `destino`. Um relatório
+# novo é renomeado de uma vez; um existente tem cada arquivo trocado de uma vez, com
+# resumo.json por último, de modo que a pasta nunca fica ausente para quem já a encontrou.
+def _publicar(temporario, destino):
+    try:
+        os.rename(temporario, destino)
+        return
+    except OSError:
+        if not os.path.isdir(destino):
+            raise
+    nomes = sorted(os.listdir(temporario), key=lambda nome: nome == "resumo.json")
+    for nome in nomes:
+        os.replace(os.path.join(temporario, nome), os.path.join(destino, nome))
+    os.rmdir(temporario)
+
+
+def _gerar(tarefa):
+    return gerar_relatorio(*tarefa)
+
+
+# Função para listar os períodos padrão de uma aba: o período completo (o filtro inicial
+# do painel) e os últimos `meses` meses fechados, limitados ao intervalo com dados
+def periodos_padrao(metadados, meses):
+    if not metadados["data_min"]:
+        return []
+    data_min = date.fromisoformat(metadados["data_min"][:10])
+    data_max = date.fromisoformat(metadados["data_max"][:10])
+    periodos = [(data_min, data_max)]
+    for mes in pd.period_range(end=pd.Period(data_max, "M"), periods=meses, freq="M"):
+        inicio, fim = max(mes.start_time.date(), data_min), min(mes.end_time.date(), data_max)
+        if inicio <= fim and (inicio, fim) not in periodos:
+            periodos.append((inicio, fim))
+    return periodos
+
+
+# Função para interpretar as combinações de UFs: "todos" (todas as UFs da aba) ou UFs
+# separadas por vírgula. Sem combinações, usa todas as UFs juntas e cada UF sozinha.
+# UFs que não existem na aba são descartadas com um aviso (o painel nunca pediria um
+# relatório com elas), assim como as combinações que ficam vazias.
+def combinacoes_estados(chave, metadados, pedidas):
+    ufs = metadados["ufs"]
+    if not pedidas:
+        return [ufs] + [[uf] for uf in ufs] if len(ufs) > 1 else [ufs]
+    combinacoes = []
+    for combinacao in pedidas:
+        if combinacao == "todos":
+            combinacoes.append(ufs)
+            continue
+        pedidas_uf = [uf.strip().upper() for uf in combinacao.split(",") if uf.strip()]
+        desconhecidas = sorted(set(pedidas_uf) - set(ufs))
+        if desconhecidas:
+            print(f"Aviso: UFs sem dados em {chave} ignoradas em '{combinacao}': {', '.join(desconhecidas)} "
+                  f"(UFs válidas: {', '.join(ufs)})", file=sys.stderr)
+        validas = sorted(set(pedidas_uf) & set(ufs))
+        if validas and validas not in combinacoes:
+            combinacoes.append(validas)
+    return combinacoes
+
+
+# Comando para pré-gerar relatórios estáticos (métricas, gráficos em HTML/JSON e tabelas
+# agregadas) para combinações de UFs e períodos, em paralelo. O painel serve esses arquivos
+# diretamente quando o filtro escolhido corresponde a um deles:
+#   python relatorios.py --meses 12 --estados todos BA RJ
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-gera relatórios estáticos do painel PEP/PrEP.")
+    parser.add_argument("--arquivo", default=dados.ARQUIVO_DADOS, help="planilha de origem")
+    parser.add_argument("--abas", nargs="+", default=list(graficos.PAGINAS), choices=list(graficos.PAGINAS))
+    parser.add_argument("--estados", nargs="+", default=[],
+                        help='combinações de UFs ("todos" ou UFs separadas por vírgula, ex.: BA,RJ); '
+                             "padrão: todas juntas e cada UF sozinha")
+    parser.add_argument("--periodos", nargs="+", default=[],
+                        help="períodos AAAA-MM-DD:AAAA-MM-DD; padrão: período completo e os últimos --meses meses")
+    parser.add_argument("--meses", type=int, default=12, help="quantidade de meses nos períodos padrão")
+    parser.add_argument("--processos", type=int, default=None, help="processos do pool (padrão: um por CPU)")
+    parser.add_argument("--saida", default=PASTA_RELATORIOS, help="pasta dos relatórios")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    try:
+        dados.preparar_todas(args.arquivo)
+    except FileNotFoundError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    tarefas = []
+    for chave in args.abas:
+        versao = dados.versao_dados(chave, args.arquivo)
+        metadados = dados.ler_metadados(chave, args.arquivo)
+        if args.periodos:
+            periodos = [tuple(date.fromisoformat(data) for data in periodo.split(":")) for periodo in args.periodos]
+        else:
+            periodos = periodos_padrao(metadados, args.meses)
+        for estados in combinacoes_estados(chave, metadados, args.estados):
+            for data_inicio, data_fim in periodos:
+                tarefas.append((chave, versao, estados, data_inicio, data_fim, args.saida, args.arquivo))
+        # Relatórios de versões anteriores dos dados ou do registro da página nunca mais são servidos
+        pasta_aba = os.path.join(args.saida, chave)
+        if os.path.isdir(pasta_aba):
+            for anterior in os.listdir(pasta_aba):
+                if anterior != pasta_versao(chave, versao):
+                    shutil.rmtree(os.path.join(pasta_aba, anterior), ignore_errors=True)
+
+    if args.processos == 1 or len(tarefas) <= 1:
+        gerados = [_gerar(tarefa) for tarefa in tarefas]
+    else:
+        # "spawn", como em dados.preparar_todas; cada processo abre os cubos uma única vez
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.processos, mp_context=contexto) as executor:
+            gerados = list(executor.map(_gerar, tarefas, chunksize=max(1, len(tarefas) // (4 * (os.cpu_count() or 1)))))
+    print(f"{len(gerados)} relatórios gerados em {args.saida} ({time.perf_counter() - inicio:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Séries temporais de dispensações: as contagens diárias (do cubo ou do backend de consulta)
+# são reamostradas no servidor e, quando longas, reduzidas por LTTB antes de irem ao Plotly.
+
+# Frequências oferecidas: rótulo -> regra do pandas (None mantém a série diária). Semanas
+# começam na segunda-feira e meses no dia 1, e cada ponto é rotulado pelo início do período.
+FREQUENCIAS = {
+    "Diária": None,
+    "Semanal": "W-MON",
+    "Mensal": "MS",
+}
+
+# Quantidade máxima de pontos enviada ao navegador por série
+LIMITE_PONTOS = 600
+
+
+# Função para reamostrar as contagens diárias (índice de datas, uma coluna por série)
+# somando os dias de cada semana ou mês
+def reamostrar(diaria, frequencia):
+    regra = FREQUENCIAS[frequencia]
+    if regra is None or diaria.empty:
+        return diaria
+    return diaria.resample(regra, label="left", closed="left").sum()
+
+
+# Função para escolher, pelo algoritmo Largest-Triangle-Three-Buckets, os índices de até
+# `limite` pontos que preservam a forma da série (picos e vales). O primeiro e o último
+# pontos são sempre mantidos; cada balde intermediário contribui com o ponto que forma o
+# maior triângulo com o ponto escolhido antes e a média do balde seguinte.
+def lttb(x, y, limite=LIMITE_PONTOS):
+    n = len(y)
+    if limite >= n or limite < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bordas = np.linspace(1, n - 1, limite - 1).astype(np.int64)
+    indices = np.empty(limite, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for balde in range(limite - 2):
+        inicio, fim = bordas[balde], bordas[balde + 1]
+        if balde + 2 < len(bordas):
+            x_seguinte = x[fim:bordas[balde + 2]].mean()
+            y_seguinte = y[fim:bordas[balde + 2]].mean()
+        else:
+            x_seguinte, y_seguinte = x[-1], y[-1]
+        areas = np.abs((x[anterior] - x_seguinte) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (y_seguinte - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        indices[balde + 1] = anterior
+    return indices